@@ -1,69 +1,114 @@
 import os
 import sys
 from google.cloud import compute_v1
+from gcp_locations import AGGREGATED_PAGE_SIZE, ALL_LOCATIONS, aggregated_items, location_label
+from gcp_inventory import open_inventory
+from gcp_operations import wait_for_operation
+from gcp_ratelimit import call, list_pages, print_stats
 
-def delete_unused_ip_addresses(project_id: str, region: str):
+def delete_unused_ip_addresses(project_id: str, region: str, inventory=None):
     """
     Finds and deletes unattached static IP addresses in a specified project and region.
     
     Args:
         project_id: The ID of the GCP project.
-        region: The GCP region to check for IP addresses.
+        region: The GCP region to check for IP addresses, or 'all' for every
+                region of the project.
+        inventory: An InventoryStore to record the listed addresses in.
+    
+    Returns:
+        A (deleted, failed) tuple: the names of the deleted addresses and a
+        dict mapping the name of each address that could not be deleted to
+        its error. A failed delete does not stop the others.
     """
     
+    all_regions = region == ALL_LOCATIONS
+    deleted, failed = [], {}
     try:
         addresses_client = compute_v1.AddressesClient()
         
-        # List all IP addresses in the target project and region
-        request = compute_v1.ListAddressesRequest(project=project_id, region=region)
-        addresses_list = addresses_client.list(request=request)
+        if all_regions:
+            # List the addresses of every region in one paged pass (global addresses are left out)
+            request = compute_v1.AggregatedListAddressesRequest(
+                project=project_id,
+                max_results=AGGREGATED_PAGE_SIZE,
+                return_partial_success=True,
+            )
+            addresses = aggregated_items(list_pages("compute.read", addresses_client.aggregated_list, request),
+                                         "addresses", "regions")
+        else:
+            # List all IP addresses in the target project and region (the pager fetches every page)
+            request = compute_v1.ListAddressesRequest(project=project_id, region=region)
+            addresses = ((region, address) for page in list_pages("compute.read", addresses_client.list, request)
+                         for address in page.items)
+        
+        # Record the listing before anything is deleted
+        addresses = list(addresses)
+        if inventory:
+            inventory.record("address", project_id, region, {
+                f"{address_region}/{address.name}": {"address": address.address, "status": address.status}
+                for address_region, address in addresses
+            })
         
         # Check for unattached IP addresses
-        for address in addresses_list.items:
+        for address_region, address in addresses:
+            name = location_label(address_region, address.name, all_regions)
             # A static IP is unused if its 'status' is 'RESERVED'
             if address.status == "RESERVED":
-                print(f"Found unused IP address: {address.name} ({address.address}). Deleting...")
+                print(f"Found unused IP address: {name} ({address.address}). Deleting...")
                 
                 # Create a delete request
                 delete_request = compute_v1.DeleteAddressRequest(
                     project=project_id,
-                    region=region,
+                    region=address_region,
                     address=address.name,
                 )
                 
-                # Execute the delete operation
-                operation = addresses_client.delete(request=delete_request)
+                try:
+                    # Execute the delete operation
+                    operation = call("compute.write", addresses_client.delete, request=delete_request)
+                    
+                    # Wait for the operation to complete
+                    wait_for_operation(operation)
+                except Exception as e:
+                    failed[name] = e
+                    print(f"Failed to delete IP address '{name}': {e}", file=sys.stderr)
+                    continue
                 
-                # Wait for the operation to complete
-                wait_for_extended_operation(operation, addresses_client)
-                
-                print(f"IP address '{address.name}' successfully deleted.")
+                deleted.append(name)
+                print(f"IP address '{name}' successfully deleted.")
             else:
-                print(f"IP address '{address.name}' ({address.status}) is in use. Skipping.")
+                print(f"IP address '{name}' ({address.status}) is in use. Skipping.")
                 
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
+    
+    if deleted or failed:
+        print(f"\nDeleted {len(deleted)} of {len(deleted) + len(failed)} unused IP addresses"
+              + (f"; {len(failed)} failed: {', '.join(sorted(failed))}" if failed else "") + ".")
+    return deleted, failed
         
-def wait_for_extended_operation(operation, client):
-    """Waits for an extended operation to complete."""
-    while operation.status != "DONE":
-        # Refresh the operation status
-        operation = client.get_region_operation(
-            project=operation.target_link.split('/')[6],
-            region=operation.target_link.split('/')[8],
-            operation=operation.name,
-        )
-    if operation.error:
-        raise Exception(f"Operation failed with error: {operation.error}")
-
 if __name__ == "__main__":
     # Get variables from environment
     project_id = os.environ.get("GCP_PROJECT_ID")
     region = os.environ.get("GCP_REGION")
+    
+    try:
+        inventory = open_inventory()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     if not project_id or not region:
-        print("Error: GCP_PROJECT_ID and GCP_REGION environment variables must be set.")
+        print("Error: GCP_PROJECT_ID and GCP_REGION environment variables must be set "
+              f"(GCP_REGION='{ALL_LOCATIONS}' covers every region).")
         sys.exit(1)
     
-    print(f"Starting IP address cleanup for project '{project_id}' in region '{region}'...")
-    delete_unused_ip_addresses(project_id, region)
\ No newline at end of file
+    where = "all regions" if region == ALL_LOCATIONS else f"region '{region}'"
+    print(f"Starting IP address cleanup for project '{project_id}' in {where}...")
+    deleted, failed = delete_unused_ip_addresses(project_id, region, inventory)
+    if inventory:
+        inventory.print_changes()
+    print_stats()
+    if failed:
+        sys.exit(1)
\ No newline at end of file
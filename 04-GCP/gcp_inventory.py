@@ -0,0 +1,183 @@
+"""
+Local inventory of GCP resources for incremental audits.
+
+Every listing a script makes (disks, addresses, instances, buckets, IAM
+bindings) can be recorded in a SQLite file named by INVENTORY_DB, with the
+time it was taken and a fingerprint of every resource. The audits read a
+listing back from that snapshot while it is younger than INVENTORY_TTL
+seconds instead of calling the API again, and every fresh listing is
+compared with the previous one so each run can report what was added,
+removed or changed since.
+
+A snapshot covers one kind of resource in one project and scope (a zone,
+region, 'all' or '' for project-wide resources) and is refreshed as a whole,
+since one list call returns all of it anyway.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Seconds a snapshot is used before the API is asked again (INVENTORY_TTL)
+DEFAULT_TTL = 3600
+
+# Names of the changed resources, per kind of change
+InventoryDiff = namedtuple("InventoryDiff", ["added", "removed", "changed"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    kind TEXT NOT NULL,
+    project TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (kind, project, scope)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    kind TEXT NOT NULL,
+    project TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    data TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (kind, project, scope, name)
+);
+"""
+
+
+def fingerprint(data) -> str:
+    """Stable hash of a resource's recorded fields."""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class InventoryStore:
+    """
+    SQLite store of resource snapshots, safe to share between threads.
+
+    Changes found while recording are collected in ``changes`` as
+    (kind, project, scope, diff) tuples, so scripts that audit many
+    projects concurrently can report them once at the end.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.changes = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Several audits may share the file, e.g. when runs overlap
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def refreshed_at(self, kind: str, project: str, scope: str = ""):
+        """Time of the last snapshot of this listing, or None if there is none."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT refreshed_at FROM snapshots WHERE kind = ? AND project = ? AND scope = ?",
+                (kind, project, scope)).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, kind: str, project: str, scope: str = "") -> bool:
+        """Whether the snapshot of this listing is younger than the TTL."""
+        refreshed_at = self.refreshed_at(kind, project, scope)
+        return refreshed_at is not None and time.time() - refreshed_at < self.ttl
+
+    def load(self, kind: str, project: str, scope: str = ""):
+        """The last snapshot of this listing as a dict of resource name -> recorded fields."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, data FROM resources WHERE kind = ? AND project = ? AND scope = ?",
+                (kind, project, scope)).fetchall()
+        return {name: json.loads(data) for name, data in rows}
+
+    def record(self, kind: str, project: str, scope: str, items):
+        """
+        Replaces the snapshot of a listing with ``items``.
+
+        Args:
+            kind: The kind of resource, e.g. 'disk' or 'bucket'.
+            project: The project the listing belongs to.
+            scope: The zone, region, 'all' or '' the listing covers.
+            items: A dict of resource name -> JSON-serialisable fields.
+
+        Returns:
+            An InventoryDiff against the previous snapshot (also added to
+            ``changes`` if anything changed), or None on the first snapshot.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            key = (kind, project, scope)
+            first = self._db.execute(
+                "SELECT 1 FROM snapshots WHERE kind = ? AND project = ? AND scope = ?", key).fetchone() is None
+            previous = dict(self._db.execute(
+                "SELECT name, fingerprint FROM resources WHERE kind = ? AND project = ? AND scope = ?", key))
+            current = {name: fingerprint(data) for name, data in items.items()}
+
+            for name, data in items.items():
+                self._db.execute(
+                    "INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (kind, project, scope, name) DO UPDATE SET "
+                    "fingerprint = excluded.fingerprint, data = excluded.data, last_seen = excluded.last_seen",
+                    key + (name, current[name], json.dumps(data, sort_keys=True, default=str), now, now))
+            removed = sorted(set(previous) - set(current))
+            self._db.executemany(
+                "DELETE FROM resources WHERE kind = ? AND project = ? AND scope = ? AND name = ?",
+                [key + (name,) for name in removed])
+            self._db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", key + (now,))
+
+            if first:
+                return None
+            diff = InventoryDiff(
+                added=sorted(set(current) - set(previous)),
+                removed=removed,
+                changed=sorted(name for name in current if name in previous and previous[name] != current[name]),
+            )
+            if any(diff):
+                self.changes.append((kind, project, scope, diff))
+            return diff
+
+    def refresh(self, kind: str, project: str, scope: str, fetch):
+        """
+        Returns a listing from its snapshot if that is still fresh, or else
+        from ``fetch()`` (a dict like ``record`` takes), recording it.
+        """
+        if self.is_fresh(kind, project, scope):
+            return self.load(kind, project, scope)
+        items = fetch()
+        self.record(kind, project, scope, items)
+        return items
+
+    def print_changes(self):
+        """Prints the changes recorded by this run, if any."""
+        if not self.changes:
+            return
+        print("\n📋 Inventory changes since the last run:")
+        for kind, project, scope, diff in self.changes:
+            where = f"{project}/{scope}" if scope else project
+            for sign, names in (("+", diff.added), ("-", diff.removed), ("~", diff.changed)):
+                for name in names:
+                    print(f"  {sign} {kind} {where}: {name}")
+
+
+def open_inventory():
+    """
+    Opens the store named by INVENTORY_DB with the TTL from INVENTORY_TTL,
+    or returns None if INVENTORY_DB is not set.
+    """
+    path = os.environ.get("INVENTORY_DB")
+    if not path:
+        return None
+    ttl = os.environ.get("INVENTORY_TTL", str(DEFAULT_TTL))
+    if not ttl.isdigit():
+        raise ValueError("INVENTORY_TTL must be a number of seconds.")
+    return InventoryStore(path, int(ttl))
@@ -0,0 +1,44 @@
+"""
+Shared helpers for scanning every zone or region of a project at once.
+
+Setting GCP_ZONE or GCP_REGION to ``all`` makes the cleanup scripts use the
+Compute Engine aggregated-list calls, which return the resources of every
+zone and region of a project in one paged pass instead of one request (and
+one script run) per location.
+"""
+
+# GCP_ZONE / GCP_REGION value that selects every location of the project
+ALL_LOCATIONS = "all"
+
+# Page size for aggregated lists (the API maximum)
+AGGREGATED_PAGE_SIZE = 500
+
+
+def aggregated_items(pages, attribute: str, scope_kind: str):
+    """
+    Yields (location, resource) for every resource in an aggregated list.
+
+    Pages are fetched lazily as the generator is consumed, so resources can
+    be acted on while the rest of the project is still being listed.
+
+    Args:
+        pages: The pages of a client's ``aggregated_list`` call, e.g. from
+               gcp_ratelimit.list_pages.
+        attribute: The field of each scoped list holding the resources,
+                   e.g. 'disks', 'addresses' or 'instances'.
+        scope_kind: 'zones' or 'regions'; resources in other scopes (such as
+                    global addresses or regional disks) are left out.
+    """
+    prefix = scope_kind + "/"
+    for page in pages:
+        for scope, scoped_list in page.items.items():
+            if not scope.startswith(prefix):
+                continue
+            location = scope[len(prefix):]
+            for resource in getattr(scoped_list, attribute):
+                yield location, resource
+
+
+def location_label(location: str, name: str, all_locations: bool) -> str:
+    """Name of a resource for messages: prefixed with its location when scanning all of them."""
+    return f"{location}/{name}" if all_locations else name
@@ -0,0 +1,186 @@
+"""
+Shared helpers for waiting on Compute Engine operations.
+
+Deleting a disk or stopping a VM returns a long-running operation. Instead
+of re-fetching it in a tight loop, a single operation is waited on with the
+API's server-side ``wait`` call (which blocks until the operation is DONE or
+about two minutes have passed), and many in-flight operations are tracked
+together by an OperationWaiter, which polls each one with exponential
+backoff and jitter from a single thread.
+"""
+import heapq
+import itertools
+import random
+import re
+import sys
+import time
+from gcp_ratelimit import call
+
+# Overall time allowed for operations to finish, in seconds
+DEFAULT_TIMEOUT = 600
+
+# Polling backoff for OperationWaiter: first delay, growth factor and cap
+INITIAL_DELAY = 1.0
+BACKOFF_FACTOR = 2.0
+MAX_DELAY = 30.0
+
+_SCOPE_PATTERN = re.compile(r'projects/([^/]+)/(?:(zones|regions)/([^/]+)/)?operations/')
+
+_clients = {}
+
+
+class OperationError(Exception):
+    """An operation finished with an error."""
+
+
+class OperationTimeoutError(OperationError, TimeoutError):
+    """An operation did not finish within the allowed time."""
+
+
+def _client(scope: str):
+    """Operations client for 'zones', 'regions' or global operations, created once."""
+    if scope not in _clients:
+        # Imported here so that importing this module stays cheap (see shutdown-vms.py)
+        from google.cloud import compute_v1
+        _clients[scope] = {
+            'zones': compute_v1.ZoneOperationsClient,
+            'regions': compute_v1.RegionOperationsClient,
+        }.get(scope, compute_v1.GlobalOperationsClient)()
+    return _clients[scope]
+
+
+def operation_scope(operation):
+    """
+    Returns (project, scope, location) of an operation, where scope is
+    'zones', 'regions' or None for global operations.
+    """
+    match = _SCOPE_PATTERN.search(operation.self_link)
+    if not match:
+        raise ValueError(f"Cannot tell where operation '{operation.name}' runs from '{operation.self_link}'")
+    return match.group(1), match.group(2), match.group(3)
+
+
+def is_done(operation) -> bool:
+    """
+    Whether an operation has finished. Its status is the enum
+    ``compute_v1.Operation.Status``, which never equals the string "DONE".
+    """
+    from google.cloud import compute_v1
+    return operation.status == compute_v1.Operation.Status.DONE
+
+
+def print_warnings(operation, key=None):
+    """Prints the warnings a finished operation reported, if any."""
+    for warning in getattr(operation, 'warnings', None) or ():
+        print(f"Warning from operation '{key or operation.name}': {warning.code}: {warning.message}",
+              file=sys.stderr)
+
+
+def operation_error(operation):
+    """Returns an OperationError describing a failed operation, or None if it succeeded."""
+    errors = getattr(operation.error, 'errors', None) if operation.error else None
+    if not errors:
+        return OperationError(operation.http_error_message) if getattr(operation, 'http_error_message', '') else None
+    return OperationError("; ".join(f"{error.code}: {error.message}" for error in errors))
+
+
+def _request(operation, method: str):
+    """Calls ``method`` ('wait' or 'get') of the right operations client for ``operation``."""
+    project, scope, location = operation_scope(operation)
+    kwargs = {'project': project, 'operation': operation.name}
+    if scope == 'zones':
+        kwargs['zone'] = location
+    elif scope == 'regions':
+        kwargs['region'] = location
+    return call("compute.operations", getattr(_client(scope), method), **kwargs)
+
+
+def wait_for_operation(operation, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Waits for an operation to finish using the API's server-side wait.
+
+    Args:
+        operation: The operation returned by a Compute Engine call.
+        timeout: Seconds to wait overall before giving up.
+
+    Returns:
+        The finished operation.
+
+    Raises:
+        OperationError: The operation finished with an error.
+        OperationTimeoutError: It did not finish within ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not is_done(operation):
+        if time.monotonic() >= deadline:
+            raise OperationTimeoutError(f"Operation '{operation.name}' did not finish within {timeout:g}s")
+        # Returns when the operation is DONE or after about two minutes
+        operation = _request(operation, 'wait')
+    print_warnings(operation)
+    error = operation_error(operation)
+    if error:
+        raise error
+    return operation
+
+
+class OperationWaiter:
+    """
+    Tracks many in-flight operations and reports each one as it finishes.
+
+    Every operation is polled with its own exponential backoff (with
+    jitter, so operations started together are not polled in lockstep),
+    and all of them share one overall deadline. Operations can be added
+    while ``as_completed`` is being iterated, e.g. to keep a fixed number
+    of deletions in flight.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, initial_delay: float = INITIAL_DELAY,
+                 max_delay: float = MAX_DELAY):
+        self.deadline = time.monotonic() + timeout
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._pending = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, operation, key=None):
+        """Tracks ``operation``; ``as_completed`` reports it under ``key`` (default: its name)."""
+        entry = [key if key is not None else operation.name, operation, self.initial_delay]
+        # A new operation is rarely done at once, so its first poll waits a little
+        due = time.monotonic() + (0 if is_done(operation) else self.initial_delay)
+        heapq.heappush(self._pending, (due, next(self._order), entry))
+
+    def as_completed(self):
+        """
+        Yields (key, error) for every tracked operation as it finishes.
+
+        ``error`` is None for a successful operation, an OperationError for a
+        failed one (or a poll that failed), and an OperationTimeoutError for
+        operations still running when the deadline passes.
+        """
+        while self._pending:
+            due, _, entry = heapq.heappop(self._pending)
+            key, operation, delay = entry
+            now = time.monotonic()
+            if now >= self.deadline:
+                yield key, OperationTimeoutError(f"Operation '{operation.name}' did not finish "
+                                                 f"within {self.timeout:g}s")
+                continue
+            if due > now:
+                time.sleep(min(due, self.deadline) - now)
+            if not is_done(operation):
+                try:
+                    operation = entry[1] = _request(operation, 'get')
+                except Exception as e:
+                    yield key, OperationError(f"Could not check operation '{operation.name}': {e}")
+                    continue
+            if is_done(operation):
+                print_warnings(operation, key)
+                yield key, operation_error(operation)
+                continue
+            delay = entry[2] = min(delay * BACKOFF_FACTOR, self.max_delay)
+            heapq.heappush(self._pending, (time.monotonic() + delay * random.uniform(0.5, 1.5),
+                                           next(self._order), entry))
@@ -0,0 +1,142 @@
+"""
+Shared helpers for running an audit over many projects at once.
+
+The projects come from the environment: an explicit list (GCP_PROJECT_IDS
+or a file named by GCP_PROJECTS_FILE), or every active project found
+under a folder or organization (GCP_FOLDER_ID / GCP_ORGANIZATION_ID),
+including nested folders. ``audit_projects`` then runs one audit function
+per project on a bounded thread pool, so one failing project never stops
+the others.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import resourcemanager_v3
+from gcp_ratelimit import list_pages
+
+# Projects audited at the same time (MAX_CONCURRENT_PROJECTS)
+DEFAULT_MAX_WORKERS = 8
+
+
+def read_project_file(path: str):
+    """Project IDs from a file, one per line; blank lines and '#' comments are ignored."""
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def walk_hierarchy(parent: str):
+    """
+    Yields (resource, parent, label) for every active folder and project
+    under a folder or organization, each folder before its contents.
+
+    Args:
+        parent: 'folders/<id>' or 'organizations/<id>'. Sub-folders are
+                searched as well.
+
+    Projects are named 'projects/<project ID>', folders 'folders/<id>';
+    the label is the project ID or the folder's display name.
+    """
+    projects_client = resourcemanager_v3.ProjectsClient()
+    folders_client = resourcemanager_v3.FoldersClient()
+    active = resourcemanager_v3.Project.State.ACTIVE
+
+    parents = [parent]
+    while parents:
+        current = parents.pop()
+        request = resourcemanager_v3.ListProjectsRequest(parent=current)
+        for page in list_pages("resourcemanager", projects_client.list_projects, request):
+            for project in page.projects:
+                if project.state == active:
+                    yield f"projects/{project.project_id}", current, project.project_id
+        request = resourcemanager_v3.ListFoldersRequest(parent=current)
+        for page in list_pages("resourcemanager", folders_client.list_folders, request):
+            for folder in page.folders:
+                yield folder.name, current, folder.display_name
+                parents.append(folder.name)
+
+
+def discover_projects(parent: str):
+    """
+    Returns the IDs of all active projects under a folder or organization.
+
+    Args:
+        parent: 'folders/<id>' or 'organizations/<id>'. Sub-folders are
+                searched as well.
+    """
+    return sorted(label for name, _, label in walk_hierarchy(parent) if name.startswith("projects/"))
+
+
+def hierarchy_root_from_environment():
+    """'folders/<GCP_FOLDER_ID>' or 'organizations/<GCP_ORGANIZATION_ID>', or None if neither is set."""
+    if os.environ.get("GCP_FOLDER_ID"):
+        return f"folders/{os.environ['GCP_FOLDER_ID']}"
+    if os.environ.get("GCP_ORGANIZATION_ID"):
+        return f"organizations/{os.environ['GCP_ORGANIZATION_ID']}"
+    return None
+
+
+def projects_from_environment():
+    """
+    Returns the project IDs selected by the multi-project environment
+    variables, or None if none of them is set.
+
+    GCP_PROJECT_IDS (comma-separated) and GCP_PROJECTS_FILE are combined;
+    otherwise GCP_FOLDER_ID or GCP_ORGANIZATION_ID select every project
+    underneath. Duplicates are dropped, keeping the first occurrence.
+    """
+    project_ids = []
+    if os.environ.get("GCP_PROJECT_IDS"):
+        project_ids += [p.strip() for p in os.environ["GCP_PROJECT_IDS"].split(",") if p.strip()]
+    if os.environ.get("GCP_PROJECTS_FILE"):
+        project_ids += read_project_file(os.environ["GCP_PROJECTS_FILE"])
+    if not project_ids:
+        root = hierarchy_root_from_environment()
+        if root is None:
+            return None
+        project_ids = discover_projects(root)
+    return list(dict.fromkeys(project_ids))
+
+
+def max_workers_from_environment() -> int:
+    """MAX_CONCURRENT_PROJECTS as a positive integer (DEFAULT_MAX_WORKERS if unset)."""
+    value = os.environ.get("MAX_CONCURRENT_PROJECTS", str(DEFAULT_MAX_WORKERS))
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError("MAX_CONCURRENT_PROJECTS must be a positive integer.")
+    return int(value)
+
+
+def audit_projects(project_ids, audit, max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Runs ``audit(project_id)`` for every project on a bounded thread pool.
+
+    Args:
+        project_ids: The projects to audit.
+        audit: Function taking a project ID and returning its findings; it
+               should not print, as projects are audited concurrently.
+        max_workers: How many projects are audited at the same time.
+
+    Returns:
+        A (results, failures) tuple of dicts keyed by project ID, both in
+        the order of ``project_ids``: the findings of every project that
+        was audited, and the exception of every project that failed.
+    """
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {project_id: executor.submit(audit, project_id) for project_id in project_ids}
+        for project_id, future in futures.items():
+            try:
+                outcomes[project_id] = (future.result(), None)
+            except Exception as e:
+                outcomes[project_id] = (None, e)
+
+    results = {p: result for p, (result, error) in outcomes.items() if error is None}
+    failures = {p: error for p, (result, error) in outcomes.items() if error is not None}
+    return results, failures
+
+
+def print_failures(failures, what: str = "project(s)"):
+    """Prints the projects (or other resources) that could not be audited, if any."""
+    if failures:
+        print(f"\n❌ {len(failures)} {what} could not be audited:")
+        for project_id, error in failures.items():
+            print(f"- {project_id}: {error}")
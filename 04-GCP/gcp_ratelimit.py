@@ -0,0 +1,241 @@
+"""
+Shared pacing and retrying of Google Cloud API calls.
+
+Every API call the scripts make goes through ``call(group, method, ...)``,
+where the group names the API and quota it counts against (e.g.
+'compute.read' or 'storage'). Each group is paced by its own token bucket,
+so many threads together stay under the group's requests-per-second rate,
+and calls failing with a retryable error (429, quota/rate-limit errors,
+5xx) are retried with exponential backoff. Calls of the write groups
+(deletes, stops) are not idempotent and are only retried after a throttling
+error, which means the request was not applied. A throttling error also pauses
+the whole group, not just the call that hit it. Calls, retries and the
+time spent waiting are counted per group and can be printed at the end of
+a run with ``print_stats``.
+"""
+import os
+import random
+import threading
+import time
+from google.api_core import exceptions
+
+# Requests per second per group; API_RATE_LIMITS overrides them, e.g. "compute.write=5,storage=50"
+DEFAULT_RATES = {
+    "compute.read": 20.0,
+    "compute.write": 10.0,
+    "compute.operations": 20.0,
+    "storage": 20.0,
+    "resourcemanager": 10.0,
+}
+
+# Retries of a failing call (API_MAX_RETRIES) and their backoff, in seconds
+MAX_RETRIES = 6
+INITIAL_BACKOFF = 1.0
+MAX_BACKOFF = 32.0
+
+RETRYABLE_ERRORS = (
+    exceptions.TooManyRequests,
+    exceptions.ResourceExhausted,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    exceptions.DeadlineExceeded,
+)
+
+# Groups whose calls change resources: a 5xx or timeout may come after the
+# change was applied, and a retry would then fail with NotFound or Conflict
+NON_IDEMPOTENT_GROUPS = ("compute.write",)
+
+# Reasons of the 403 errors some APIs return instead of 429 when rate limited
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def is_retryable(error: Exception, group: str = None) -> bool:
+    """Whether a failed call of ``group`` may succeed if it is simply tried again later."""
+    if group in NON_IDEMPOTENT_GROUPS:
+        return is_throttled(error)
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, exceptions.Forbidden) and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+def is_throttled(error: Exception) -> bool:
+    """Whether a failed call was rejected for exceeding a rate or quota."""
+    return isinstance(error, (exceptions.TooManyRequests, exceptions.ResourceExhausted)) or (
+        isinstance(error, exceptions.Forbidden) and any(reason in str(error) for reason in RATE_LIMIT_REASONS))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing ``rate`` calls per second on average
+    and bursts of up to ``burst`` calls.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping until it is available; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: each caller reserves its slot and sleeps outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """Hands out no tokens for the next ``seconds`` (pauses do not add up)."""
+        with self._lock:
+            # Refill up to now first, so the time before the pause is not credited after it
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """Paces and retries calls per group, keeping counters for each group."""
+
+    def __init__(self, rates=None, max_retries: int = MAX_RETRIES):
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _group(self, group: str):
+        with self._lock:
+            if group not in self._buckets:
+                self._buckets[group] = TokenBucket(self.rates.get(group, min(DEFAULT_RATES.values())))
+                self._stats[group] = {"calls": 0, "retries": 0, "failures": 0, "throttled_s": 0.0}
+            return self._buckets[group], self._stats[group]
+
+    def call(self, group: str, method, *args, **kwargs):
+        """
+        Calls ``method(*args, **kwargs)`` paced by the bucket of ``group``,
+        retrying retryable errors (only throttling errors for the groups in
+        NON_IDEMPOTENT_GROUPS) with exponential backoff and jitter.
+
+        Raises:
+            The last error if the call is not retryable or keeps failing.
+        """
+        bucket, stats = self._group(group)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                retry = attempt < self.max_retries and is_retryable(e, group)
+                with self._lock:
+                    stats["calls"] += 1
+                    stats["throttled_s"] += waited
+                    stats["retries" if retry else "failures"] += 1
+                if not retry:
+                    raise
+                backoff = min(INITIAL_BACKOFF * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.5)
+                if is_throttled(e):
+                    # Everyone calling this group backs off, not only this caller
+                    bucket.pause(backoff)
+                else:
+                    time.sleep(backoff)
+                    with self._lock:
+                        stats["throttled_s"] += backoff
+                attempt += 1
+                continue
+            with self._lock:
+                stats["calls"] += 1
+                stats["throttled_s"] += waited
+            return result
+
+    def stats(self):
+        """Counters per group: calls, retries, failures and seconds spent waiting."""
+        with self._lock:
+            return {group: dict(stats) for group, stats in self._stats.items()}
+
+    def reset_stats(self):
+        """Sets all counters back to zero; the pacing state is kept."""
+        with self._lock:
+            for stats in self._stats.values():
+                stats.update(calls=0, retries=0, failures=0, throttled_s=0.0)
+
+
+def rates_from_environment():
+    """Rate overrides from API_RATE_LIMITS ("group=requests per second,...")."""
+    rates = {}
+    for part in os.environ.get("API_RATE_LIMITS", "").split(","):
+        if not part.strip():
+            continue
+        group, _, rate = part.partition("=")
+        try:
+            rates[group.strip()] = float(rate)
+        except ValueError:
+            raise ValueError(f"API_RATE_LIMITS: invalid rate for '{group.strip()}': '{rate}'")
+        if rates[group.strip()] <= 0:
+            raise ValueError(f"API_RATE_LIMITS: the rate for '{group.strip()}' must be positive")
+    return rates
+
+
+def limiter() -> RateLimiter:
+    """The process-wide RateLimiter, configured from the environment on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            retries = os.environ.get("API_MAX_RETRIES", str(MAX_RETRIES))
+            if not retries.isdigit():
+                raise ValueError("API_MAX_RETRIES must be a non-negative integer.")
+            _default = RateLimiter(rates_from_environment(), int(retries))
+        return _default
+
+
+def call(group: str, method, *args, **kwargs):
+    """Calls ``method(*args, **kwargs)`` through the process-wide RateLimiter."""
+    return limiter().call(group, method, *args, **kwargs)
+
+
+def list_pages(group: str, method, request):
+    """
+    Yields every page of a paged list call (e.g. ``disks_client.list``),
+    fetching each page through ``call`` so that every page request is paced
+    and retried, not only the first one.
+
+    Args:
+        group: The rate-limit group of the list call.
+        method: The client's list method.
+        request: The list request; its page_token is advanced in place.
+    """
+    while True:
+        page = call(group, method, request=request)
+        yield page
+        if not page.next_page_token:
+            return
+        request.page_token = page.next_page_token
+
+
+def reset_stats():
+    """Clears the call counters, e.g. between invocations of a warm Cloud Function."""
+    if _default:
+        _default.reset_stats()
+
+
+def print_stats():
+    """Prints the call counters of this run, if any calls were made."""
+    stats = _default.stats() if _default else {}
+    if not stats:
+        return
+    print("\n📈 API calls:")
+    for group, counters in sorted(stats.items()):
+        print(f"  {group}: {counters['calls']} calls, {counters['retries']} retries, "
+              f"{counters['failures']} failed, {counters['throttled_s']:.1f}s throttled")
@@ -1,51 +1,210 @@
 import os
 import sys
 from google.cloud import resourcemanager_v3
+from gcp_inventory import open_inventory
+from gcp_ratelimit import call, print_stats
+from gcp_iam import IamIndex, policy_bindings, role_of
+from gcp_projects import (audit_projects, hierarchy_root_from_environment, max_workers_from_environment,
+                          print_failures, projects_from_environment)
 
-def review_broad_iam_roles(project_id: str):
+BROAD_ROLES = ["roles/owner", "roles/editor"]
+
+def fetch_bindings(project_id: str, client=None):
     """
-    Reviews the IAM policies for a given project to identify members with broad roles.
+    Returns all role bindings of a project's IAM policy.
+    
+    Args:
+        project_id: The ID of the GCP project to audit.
+        client: A resourcemanager_v3.ProjectsClient to reuse (one is created if not given).
+    
+    Returns:
+        A dict mapping each role (with its condition, if any) to its sorted members.
+    """
+    client = client or resourcemanager_v3.ProjectsClient()
+    
+    # Get the project's IAM policy; version 3 returns conditional bindings with their conditions
+    policy = call("resourcemanager", client.get_iam_policy, request={
+        "resource": f"projects/{project_id}",
+        "options": {"requested_policy_version": 3},
+    })
+    return policy_bindings(policy)
 
+def find_broad_roles(project_id: str, client=None, inventory=None):
+    """
+    Returns the broad role bindings of a project's IAM policy.
+    
     Args:
         project_id: The ID of the GCP project to audit.
+        client: A resourcemanager_v3.ProjectsClient to reuse (one is created if not given).
+        inventory: An InventoryStore; while its snapshot of the project's
+                   bindings is fresh, the policy is not fetched again.
+    
+    Returns:
+        A list of (role, members) tuples, one per binding of a broad role.
+    """
+    if inventory:
+        bindings = inventory.refresh("iam_binding", project_id, "",
+                                     lambda: fetch_bindings(project_id, client))
+    else:
+        bindings = fetch_bindings(project_id, client)
+    
+    # Keep every binding of a broad role
+    return [(name, members) for name, members in bindings.items()
+            if role_of(name) in BROAD_ROLES]
+
+def review_broad_iam_roles(project_id: str, inventory=None):
     """
+    Reviews the IAM policies for a given project to identify members with broad roles.
     
-    broad_roles = ["roles/owner", "roles/editor"]
+    Args:
+        project_id: The ID of the GCP project to audit.
+        inventory: An InventoryStore to read and record the bindings.
+    """
     
     try:
-        client = resourcemanager_v3.ProjectsClient()
+        findings = find_broad_roles(project_id, inventory=inventory)
         
-        # Get the project's IAM policy
-        policy = client.get_iam_policy(resource=f"projects/{project_id}")
-        
-        found_violations = False
         print(f"Auditing IAM policy for project: {project_id}\n")
         
-        # Iterate through each binding in the policy
-        for binding in policy.bindings:
-            role = binding.role
-            
-            # Check if the role is a broad role
-            if role in broad_roles:
-                found_violations = True
-                print(f"🚨 Found broad role '{role}' assigned to the following members:")
-                for member in binding.members:
-                    print(f"- {member}")
-                print("-" * 50)
+        for role, members in findings:
+            print(f"🚨 Found broad role '{role}' assigned to the following members:")
+            for member in members:
+                print(f"- {member}")
+            print("-" * 50)
         
-        if not found_violations:
+        if not findings:
             print("✅ No broad roles were found in the project's IAM policy.")
-            
+    
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
         sys.exit(1)
 
+def review_projects(project_ids, max_workers: int, inventory=None):
+    """
+    Reviews the IAM policies of many projects concurrently and prints one
+    consolidated report. A project that cannot be audited is reported and
+    does not stop the others.
+    
+    Args:
+        project_ids: The IDs of the GCP projects to audit.
+        max_workers: How many projects are audited at the same time.
+        inventory: An InventoryStore shared by all projects.
+    
+    Returns:
+        A dict mapping each project that could not be audited to its error.
+    """
+    # The client is thread-safe, so all workers share one
+    client = resourcemanager_v3.ProjectsClient()
+    print(f"Auditing IAM policies of {len(project_ids)} projects ({max_workers} at a time)...\n")
+    results, failures = audit_projects(project_ids, lambda p: find_broad_roles(p, client, inventory), max_workers)
+    
+    flagged = {project_id: findings for project_id, findings in results.items() if findings}
+    for project_id, findings in flagged.items():
+        print(f"🚨 Project '{project_id}':")
+        for role, members in findings:
+            print(f"  '{role}': {', '.join(members)}")
+    
+    print("\n" + "="*50)
+    print(f"Summary: {len(results)} of {len(project_ids)} projects audited; "
+          f"{len(flagged)} with broad roles, {len(results) - len(flagged)} clean.")
+    print_failures(failures)
+    return failures
+
+def review_hierarchy(root: str, max_workers: int, member: str = None, roles=BROAD_ROLES):
+    """
+    Reviews the IAM policies of a whole folder or organization, including
+    the bindings every resource inherits from the folders and organization
+    above it, and prints which members hold the given roles where.
+    
+    Every policy is fetched once; the answer then comes from the member
+    index of an IamIndex (see gcp_iam.py).
+    
+    Args:
+        root: 'folders/<id>' or 'organizations/<id>'.
+        max_workers: How many policies are fetched at the same time.
+        member: Only report this member (e.g. 'user:alice@example.com').
+        roles: The roles to report.
+    
+    Returns:
+        A dict mapping each resource whose policy could not be fetched to its error.
+    """
+    print(f"Auditing IAM policies under {root}, including inherited bindings...\n")
+    index = IamIndex(max_workers)
+    index.load(root)
+    
+    flagged = 0
+    for name in ([member] if member else sorted(index.members)):
+        # Group the member's grants by where they are set: one line per binding
+        # and source, with the number of resources that inherit it
+        inherited_by = {}
+        for resource, binding, source in index.grants(name, roles):
+            inherited_by.setdefault((binding, source), []).append(resource)
+        if not inherited_by:
+            continue
+        flagged += 1
+        print(f"🚨 {name}:")
+        for (binding, source), resources in sorted(inherited_by.items(), key=lambda item: item[0][1]):
+            below = len(resources) - (source in resources)
+            print(f"  '{binding}' on {index.label(source)}"
+                  + (f", inherited by {below} resource(s) below it" if below else ""))
+    
+    print("\n" + "="*50)
+    if member and not flagged:
+        print(f"✅ {member} has none of {', '.join(roles)} anywhere under {root}.")
+    else:
+        print(f"Summary: {len(index.bindings)} of {len(index.parents)} policies read; "
+              f"{flagged} member(s) with {' or '.join(roles)}.")
+    print_failures(index.failures, "resource(s)")
+    return index.failures
+
 if __name__ == "__main__":
     # Get the project ID from an environment variable
     project_id = os.environ.get("GCP_PROJECT_ID")
-
-    if not project_id:
-        print("Error: The GCP_PROJECT_ID environment variable must be set.")
+    
+    # IAM_MEMBER or IAM_HIERARCHY select the inheritance-aware review of a folder or organization
+    member = os.environ.get("IAM_MEMBER")
+    hierarchy = bool(member) or os.environ.get("IAM_HIERARCHY", "").lower() in ("1", "true", "yes")
+    roles = [role.strip() for role in os.environ.get("IAM_ROLES", ",".join(BROAD_ROLES)).split(",") if role.strip()]
+    
+    try:
+        # A project list, folder or organization selects the multi-project mode
+        project_ids = None if hierarchy else projects_from_environment()
+        max_workers = max_workers_from_environment()
+        inventory = None if hierarchy else open_inventory()
+    except Exception as e:
+        print(f"Error: {e}")
         sys.exit(1)
-        
-    review_broad_iam_roles(project_id)
\ No newline at end of file
+    
+    if hierarchy:
+        root = hierarchy_root_from_environment()
+        if not root:
+            print("Error: IAM_MEMBER and IAM_HIERARCHY need GCP_FOLDER_ID or GCP_ORGANIZATION_ID to be set.")
+            sys.exit(1)
+        try:
+            failures = review_hierarchy(root, max_workers, member, roles)
+        except Exception as e:
+            print(f"An error occurred: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            print_stats()
+        sys.exit(1 if failures else 0)
+    
+    if project_ids is None and not project_id:
+        print("Error: The GCP_PROJECT_ID environment variable must be set "
+              "(or GCP_PROJECT_IDS, GCP_PROJECTS_FILE, GCP_FOLDER_ID or GCP_ORGANIZATION_ID).")
+        sys.exit(1)
+    
+    try:
+        if project_ids is not None:
+            if not project_ids:
+                print("Error: No projects to audit were found.")
+                sys.exit(1)
+            if review_projects(project_ids, max_workers, inventory):
+                sys.exit(1)
+        else:
+            review_broad_iam_roles(project_id, inventory)
+    finally:
+        if inventory:
+            inventory.print_changes()
+            inventory.close()
+        print_stats()
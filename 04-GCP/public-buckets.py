@@ -1,59 +1,259 @@
+import json
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage
+from gcp_inventory import open_inventory
+from gcp_ratelimit import call, print_stats
+from gcp_projects import audit_projects, max_workers_from_environment, print_failures, projects_from_environment
 
-def check_for_public_buckets(project_id: str):
+# These are the members that grant public access
+PUBLIC_MEMBERS = ["allUsers", "allAuthenticatedUsers"]
+
+# IAM policies fetched at the same time per project (MAX_CONCURRENT_BUCKETS);
+# the storage client's HTTP connection pool holds 10 connections
+DEFAULT_MAX_BUCKET_WORKERS = 10
+
+# Where audit results are cached between runs (BUCKET_POLICY_CACHE; empty disables it)
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "gcp-audits", "public-buckets.json")
+
+class PolicyCache:
     """
-    Checks all buckets in a project for public access and reports findings.
+    On-disk cache of bucket audit results, so unchanged buckets are not
+    re-fetched on later runs.
+    
+    Entries are keyed by bucket name and are only used while the bucket's
+    metageneration and etag match the ones seen when the policy was fetched;
+    both change whenever the bucket's metadata or IAM policy does.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+    
+    def get(self, bucket):
+        """Returns the cached entry for ``bucket`` if it is still current, else None."""
+        entry = self._entries.get(bucket.name)
+        current = (entry is not None and entry["metageneration"] == bucket.metageneration
+                   and entry["etag"] == bucket.etag)
+        with self._lock:
+            if current:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry if current else None
+    
+    def put(self, bucket, role):
+        """Records the audit result of ``bucket`` (the role that makes it public, or None)."""
+        with self._lock:
+            self._entries[bucket.name] = {
+                "metageneration": bucket.metageneration,
+                "etag": bucket.etag,
+                "public_role": role,
+            }
+    
+    def save(self):
+        """Writes the cache to disk, replacing the previous file atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self._entries, f)
+        os.replace(self.path + ".tmp", self.path)
 
+def public_role(bucket):
+    """Returns the first role that makes ``bucket`` public, or None."""
+    # Get the IAM policy for the current bucket
+    policy = call("storage", bucket.get_iam_policy, requested_policy_version=3)
+    
+    # Iterate through each role binding in the policy
+    for binding in policy.bindings:
+        # Check if any public member is present
+        if any(member in binding["members"] for member in PUBLIC_MEMBERS):
+            return binding["role"]
+    return None
+
+def audit_buckets(project_id: str, cache: PolicyCache = None,
+                  max_workers: int = DEFAULT_MAX_BUCKET_WORKERS):
+    """
+    Lists the buckets of a project and finds the role that makes each one
+    public, fetching the IAM policies concurrently.
+    
     Args:
         project_id: The ID of the GCP project to audit.
+        cache: A PolicyCache; only buckets that changed since they were
+               cached have their IAM policy fetched.
+        max_workers: How many IAM policies are fetched at the same time.
+    
+    Returns:
+        A dict mapping each bucket name to its metageneration, etag and
+        public role (None if the bucket is not public).
     """
+    # Initialize the storage client for the specified project
+    client = storage.Client(project=project_id)
+    
+    # List all buckets in the project (as a whole, so a retry can simply start over)
+    buckets, stale = {}, []
+    for bucket in call("storage", lambda: list(client.list_buckets())):
+        entry = cache.get(bucket) if cache else None
+        buckets[bucket.name] = {
+            "metageneration": bucket.metageneration,
+            "etag": bucket.etag,
+            "public_role": entry["public_role"] if entry else None,
+        }
+        if not entry:
+            stale.append(bucket)
     
-    # These are the members that grant public access
-    public_members = ["allUsers", "allAuthenticatedUsers"]
+    # Fetch the policies of new and changed buckets concurrently
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for bucket, role in zip(stale, executor.map(public_role, stale)):
+            buckets[bucket.name]["public_role"] = role
+            if cache:
+                cache.put(bucket, role)
+    
+    return buckets
+
+def find_public_buckets(project_id: str, cache: PolicyCache = None,
+                        max_workers: int = DEFAULT_MAX_BUCKET_WORKERS, inventory=None):
+    """
+    Returns the buckets of a project that grant public access.
+    
+    Args:
+        project_id: The ID of the GCP project to audit.
+        cache: A PolicyCache; only buckets that changed since they were
+               cached have their IAM policy fetched.
+        max_workers: How many IAM policies are fetched at the same time.
+        inventory: An InventoryStore; while its snapshot of the project's
+                   buckets is fresh, no API calls are made at all.
+    
+    Returns:
+        A list of (bucket name, role) tuples, one per public bucket, naming
+        the first role that makes it public.
+    """
+    if inventory:
+        buckets = inventory.refresh("bucket", project_id, "",
+                                    lambda: audit_buckets(project_id, cache, max_workers))
+    else:
+        buckets = audit_buckets(project_id, cache, max_workers)
+    return [(name, bucket["public_role"]) for name, bucket in buckets.items() if bucket["public_role"]]
+
+def check_for_public_buckets(project_id: str, cache: PolicyCache = None,
+                             bucket_workers: int = DEFAULT_MAX_BUCKET_WORKERS, inventory=None):
+    """
+    Checks all buckets in a project for public access and reports findings.
+    
+    Args:
+        project_id: The ID of the GCP project to audit.
+        cache: A PolicyCache to reuse the results of unchanged buckets from.
+        bucket_workers: How many IAM policies are fetched at the same time.
+        inventory: An InventoryStore to read and record the buckets.
+    """
     
     try:
-        # Initialize the storage client for the specified project
-        client = storage.Client(project=project_id)
-        
-        # List all buckets in the project
-        buckets = client.list_buckets()
+        public_buckets = find_public_buckets(project_id, cache, bucket_workers, inventory)
         
         print(f"Auditing Cloud Storage buckets for project: {project_id}\n")
         
-        public_buckets = []
-        for bucket in buckets:
-            # Get the IAM policy for the current bucket
-            policy = bucket.get_iam_policy(requested_policy_version=3)
-            
-            # Iterate through each role binding in the policy
-            for binding in policy.bindings:
-                # Check if any public member is present
-                if any(member in binding["members"] for member in public_members):
-                    print(f"🚨 WARNING: Bucket '{bucket.name}' is publicly accessible via the role '{binding['role']}'.")
-                    public_buckets.append(bucket.name)
-                    # We can break from this inner loop once a violation is found for a bucket
-                    break
+        for bucket_name, role in public_buckets:
+            print(f"🚨 WARNING: Bucket '{bucket_name}' is publicly accessible via the role '{role}'.")
         
         print("\n" + "="*50)
         if public_buckets:
             print("Summary: The following buckets have public access permissions:")
-            for bucket_name in public_buckets:
+            for bucket_name, _ in public_buckets:
                 print(f"- {bucket_name}")
         else:
             print("✅ All buckets checked are secure and do not have public access.")
-            
+    
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
         sys.exit(1)
 
+def check_projects(project_ids, max_workers: int, cache: PolicyCache = None,
+                   bucket_workers: int = DEFAULT_MAX_BUCKET_WORKERS, inventory=None):
+    """
+    Checks the buckets of many projects concurrently and prints one
+    consolidated report. A project that cannot be audited is reported and
+    does not stop the others.
+    
+    Args:
+        project_ids: The IDs of the GCP projects to audit.
+        max_workers: How many projects are audited at the same time.
+        cache: A PolicyCache shared by all projects.
+        bucket_workers: How many IAM policies are fetched at the same time
+                        per project.
+        inventory: An InventoryStore shared by all projects.
+    
+    Returns:
+        A dict mapping each project that could not be audited to its error.
+    """
+    print(f"Auditing Cloud Storage buckets of {len(project_ids)} projects ({max_workers} at a time)...\n")
+    results, failures = audit_projects(
+        project_ids, lambda p: find_public_buckets(p, cache, bucket_workers, inventory), max_workers)
+    
+    flagged = {project_id: buckets for project_id, buckets in results.items() if buckets}
+    for project_id, buckets in flagged.items():
+        print(f"🚨 Project '{project_id}':")
+        for bucket_name, role in buckets:
+            print(f"  Bucket '{bucket_name}' is publicly accessible via the role '{role}'.")
+    
+    print("\n" + "="*50)
+    print(f"Summary: {len(results)} of {len(project_ids)} projects audited; "
+          f"{sum(len(b) for b in flagged.values())} public buckets in {len(flagged)} projects.")
+    print_failures(failures)
+    return failures
+
 if __name__ == "__main__":
     # Get the project ID from an environment variable
     project_id = os.environ.get("GCP_PROJECT_ID")
-
-    if not project_id:
-        print("Error: The GCP_PROJECT_ID environment variable must be set.")
+    
+    try:
+        # A project list, folder or organization selects the multi-project mode
+        project_ids = projects_from_environment()
+        max_workers = max_workers_from_environment()
+        inventory = open_inventory()
+    except Exception as e:
+        print(f"Error: {e}")
         sys.exit(1)
-        
-    check_for_public_buckets(project_id)
\ No newline at end of file
+    
+    bucket_workers = os.environ.get("MAX_CONCURRENT_BUCKETS", str(DEFAULT_MAX_BUCKET_WORKERS))
+    if not bucket_workers.isdigit() or int(bucket_workers) < 1:
+        print("Error: MAX_CONCURRENT_BUCKETS must be a positive integer.")
+        sys.exit(1)
+    bucket_workers = int(bucket_workers)
+    
+    if project_ids is None and not project_id:
+        print("Error: The GCP_PROJECT_ID environment variable must be set "
+              "(or GCP_PROJECT_IDS, GCP_PROJECTS_FILE, GCP_FOLDER_ID or GCP_ORGANIZATION_ID).")
+        sys.exit(1)
+    
+    cache_path = os.environ.get("BUCKET_POLICY_CACHE", DEFAULT_CACHE_PATH)
+    cache = PolicyCache(cache_path) if cache_path else None
+    try:
+        if project_ids is not None:
+            if not project_ids:
+                print("Error: No projects to audit were found.")
+                sys.exit(1)
+            if check_projects(project_ids, max_workers, cache, bucket_workers, inventory):
+                sys.exit(1)
+        else:
+            check_for_public_buckets(project_id, cache, bucket_workers, inventory)
+    finally:
+        if inventory:
+            inventory.print_changes()
+            inventory.close()
+        print_stats()
+        # Results are kept even if some projects failed
+        if cache:
+            print(f"\n🗂️  {cache.hits} bucket(s) unchanged since the last audit, "
+                  f"{cache.misses} policies fetched (cache: {cache.path})")
+            try:
+                cache.save()
+            except OSError as e:
+                print(f"Warning: Could not save the cache: {e}", file=sys.stderr)
@@ -1,15 +1,105 @@
 import os
 import sys
-from google.cloud import compute_v1
+import time
+from concurrent.futures import ThreadPoolExecutor
+from gcp_locations import AGGREGATED_PAGE_SIZE, ALL_LOCATIONS, aggregated_items, location_label
+from gcp_inventory import open_inventory
+from gcp_operations import OperationTimeoutError, OperationWaiter
+from gcp_ratelimit import call, list_pages, print_stats, reset_stats
+
+# Stop requests sent at the same time (MAX_CONCURRENT_STOPS). A stop call
+# returns as soon as its operation is created and the 'compute.write' rate
+# limit paces the calls anyway, so more threads would only queue on it
+DEFAULT_MAX_CONCURRENT_STOPS = 10
+
+# Seconds an invocation waits for the VMs to stop (STOP_TIMEOUT), below Cloud
+# Scheduler's default 180s attempt deadline. VMs still stopping by then are
+# reported as such and finish stopping on their own.
+DEFAULT_STOP_TIMEOUT = 150
+
+# Longest pause between two checks of a stop operation, in seconds. VMs take
+# tens of seconds to stop; shorter pauses than the shared 30s cap let the
+# (billed) invocation return soon after the last one has stopped
+STOP_POLL_MAX_DELAY = 10
+
+# Kept between invocations of the same (warm) function instance
+_instances_client = None
+
+def instances_client():
+    """
+    Returns the InstancesClient, creating it on first use.
+    
+    compute_v1 loads every Compute Engine service when imported, so it is only
+    imported once a VM actually has to be listed. The client, with its
+    authorized HTTP session (open connections and cached access token), is
+    then reused by every later invocation of this instance.
+    """
+    global _instances_client
+    if _instances_client is None:
+        from google.cloud import compute_v1
+        _instances_client = compute_v1.InstancesClient()
+    return _instances_client
+
+def list_labeled_instances(client, project_id: str, zone: str, filter_str: str):
+    """Returns (zone, instance) for every instance matching the filter, in one zone or all of them."""
+    from google.cloud import compute_v1
+    
+    if zone == ALL_LOCATIONS:
+        # List the matching instances of every zone in one paged pass
+        request = compute_v1.AggregatedListInstancesRequest(
+            project=project_id,
+            filter=filter_str,
+            max_results=AGGREGATED_PAGE_SIZE,
+            return_partial_success=True,
+        )
+        return list(aggregated_items(list_pages("compute.read", client.aggregated_list, request),
+                                     "instances", "zones"))
+    
+    request = compute_v1.ListInstancesRequest(
+        project=project_id,
+        zone=zone,
+        filter=filter_str
+    )
+    
+    # List all instances that match the filter (every page)
+    return [(zone, instance) for page in list_pages("compute.read", client.list, request)
+            for instance in page.items]
+
+def start_stop(client, project_id: str, zone: str, instance_name: str, deadline: float):
+    """
+    Starts stopping one VM and returns the stop operation, or None if the
+    deadline (a time.monotonic() value) has already passed.
+    """
+    from google.cloud import compute_v1
+    
+    if time.monotonic() >= deadline:
+        return None
+    
+    stop_request = compute_v1.StopInstanceRequest(
+        project=project_id,
+        zone=zone,
+        instance=instance_name,
+    )
+    return call("compute.write", client.stop, request=stop_request)
 
 def stop_labeled_vms(request):
     """
-    Stops all VM instances with a specific label in a given project and zone.
+    Stops all VM instances with a specific label in a given project and zone
+    (or in every zone of the project if GCP_ZONE is 'all').
     This function is designed to be triggered by Cloud Scheduler.
-
+    
+    The stop requests are sent concurrently and the function returns after at
+    most STOP_TIMEOUT seconds, so it answers within the scheduler's deadline
+    even with hundreds of VMs.
+    
     Args:
         request: A Flask request object. The body is not used, but the function
                  is triggered by an HTTP call from Cloud Scheduler.
+    
+    Returns:
+        A (message, HTTP status) tuple: 200 if every VM stopped or is still
+        stopping, 500 if any could not be stopped or was not attempted
+        because STOP_TIMEOUT ran out first, so the scheduler retries.
     """
     
     # Get configuration from environment variables
@@ -17,56 +107,97 @@ def stop_labeled_vms(request):
     zone = os.environ.get("GCP_ZONE")
     label_key = os.environ.get("VM_LABEL_KEY")
     label_value = os.environ.get("VM_LABEL_VALUE")
-
+    max_concurrent = os.environ.get("MAX_CONCURRENT_STOPS", str(DEFAULT_MAX_CONCURRENT_STOPS))
+    timeout = os.environ.get("STOP_TIMEOUT", str(DEFAULT_STOP_TIMEOUT))
+    
     if not all([project_id, zone, label_key, label_value]):
         print("Error: Required environment variables not set.")
-        sys.exit(1)
+        return "Error: Required environment variables not set.", 500
+    
+    if not max_concurrent.isdigit() or int(max_concurrent) < 1 or not timeout.isdigit():
+        print("Error: MAX_CONCURRENT_STOPS must be a positive integer and STOP_TIMEOUT a number of seconds.")
+        return "Error: Invalid MAX_CONCURRENT_STOPS or STOP_TIMEOUT.", 500
+    
+    where = "all zones" if zone == ALL_LOCATIONS else f"zone '{zone}'"
+    print(f"Stopping VMs in project '{project_id}', {where} with label '{label_key}={label_value}'...")
     
-    print(f"Stopping VMs in project '{project_id}', zone '{zone}' with label '{label_key}={label_value}'...")
+    # The waiter's deadline covers the whole invocation, listing included
+    waiter = OperationWaiter(timeout=int(timeout), max_delay=STOP_POLL_MAX_DELAY)
+    stopped, still_stopping, not_attempted, failed = [], [], [], {}
+    reset_stats()
     
     try:
-        instances_client = compute_v1.InstancesClient()
+        client = instances_client()
         
         # Build the filter for the list request
         filter_str = f'labels.{label_key}="{label_value}"'
+        instances = list_labeled_instances(client, project_id, zone, filter_str)
         
-        request = compute_v1.ListInstancesRequest(
-            project=project_id,
-            zone=zone,
-            filter=filter_str
-        )
-        
-        # List all instances that match the filter
-        instances_list = instances_client.list(request=request)
-        
-        for instance in instances_list.items:
-            # Only stop running instances
-            if instance.status == "RUNNING":
-                print(f"Stopping VM: {instance.name}...")
-                stop_request = compute_v1.StopInstanceRequest(
-                    project=project_id,
-                    zone=zone,
-                    instance=instance.name,
-                )
-                operation = instances_client.stop(request=stop_request)
-                
-                # Wait for the operation to complete
-                wait_for_extended_operation(operation, instances_client)
-                
-                print(f"VM '{instance.name}' stopped successfully.")
-            else:
-                print(f"VM '{instance.name}' is already '{instance.status}'. Skipping.")
-
+        # Record the listing (if INVENTORY_DB is set)
+        inventory = open_inventory()
+        if inventory:
+            inventory.record("instance", project_id, f"{zone} {filter_str}", {
+                f"{instance_zone}/{instance.name}": {"status": instance.status}
+                for instance_zone, instance in instances
+            })
+            inventory.print_changes()
+            inventory.close()
+    
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
+        print_stats()
+        return f"Error: {e}", 500
+    
+    running = []
+    for instance_zone, instance in instances:
+        name = location_label(instance_zone, instance.name, zone == ALL_LOCATIONS)
+        # Only stop running instances
+        if instance.status == "RUNNING":
+            print(f"Stopping VM: {name}...")
+            running.append((name, instance_zone, instance.name))
+        else:
+            print(f"VM '{name}' is already '{instance.status}'. Skipping.")
+    
+    # Send the stop requests concurrently; each returns an operation right away.
+    # No stop is sent once the deadline has passed
+    with ThreadPoolExecutor(max_workers=int(max_concurrent)) as executor:
+        futures = [(name, executor.submit(start_stop, client, project_id, instance_zone, instance_name,
+                                          waiter.deadline))
+                   for name, instance_zone, instance_name in running]
+        for name, future in futures:
+            try:
+                operation = future.result()
+                if operation is None:
+                    not_attempted.append(name)
+                    print(f"VM '{name}' was not stopped: the time ran out before its turn.", file=sys.stderr)
+                else:
+                    waiter.add(operation, name)
+            except Exception as e:
+                failed[name] = e
+                print(f"Failed to stop VM '{name}': {e}", file=sys.stderr)
+    
+    # Wait for the operations together, until they finish or time runs out
+    for name, error in waiter.as_completed():
+        if isinstance(error, OperationTimeoutError):
+            still_stopping.append(name)
+            print(f"VM '{name}' is still stopping.")
+        elif error:
+            failed[name] = error
+            print(f"Failed to stop VM '{name}': {error}", file=sys.stderr)
+        else:
+            stopped.append(name)
+            print(f"VM '{name}' stopped successfully.")
+    
+    message = (f"Stopped {len(stopped)} of {len(running)} running VMs"
+               + (f"; {len(still_stopping)} still stopping" if still_stopping else "")
+               + (f"; {len(failed)} failed: {', '.join(sorted(failed))}" if failed else "")
+               + (f"; {len(not_attempted)} not attempted (timed out): {', '.join(sorted(not_attempted))}"
+                  if not_attempted else "") + ".")
+    print(message)
+    print_stats()
+    return message, 500 if failed or not_attempted else 200
 
-def wait_for_extended_operation(operation, client):
-    """Waits for an extended operation to complete."""
-    while operation.status != "DONE":
-        operation = client.get_zone_operation(
-            project=operation.target_link.split('/')[6],
-            zone=operation.target_link.split('/')[8],
-            operation=operation.name,
-        )
-    if operation.error:
-        raise Exception(f"Operation failed with error: {operation.error}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Run once locally, outside Cloud Functions
+    message, status = stop_labeled_vms(None)
+    sys.exit(0 if status == 200 else 1)
@@ -1,71 +1,173 @@
 import os
 import sys
+import time
 from google.cloud import compute_v1
+from gcp_locations import AGGREGATED_PAGE_SIZE, ALL_LOCATIONS, aggregated_items, location_label
+from gcp_inventory import open_inventory
+from gcp_operations import DEFAULT_TIMEOUT, OperationTimeoutError, OperationWaiter
+from gcp_ratelimit import call, list_pages, print_stats
 
-def delete_unused_disks(project_id: str, zone: str):
+def delete_unused_disks(project_id: str, zone: str, max_concurrent: int = 1,
+                        timeout: float = DEFAULT_TIMEOUT, inventory=None):
     """
     Finds and deletes unattached disks in a specified project and zone.
     
     Args:
         project_id: The ID of the GCP project.
-        zone: The GCP zone to check for disks.
+        zone: The GCP zone to check for disks, or 'all' for every zone of
+              the project.
+        max_concurrent: How many deletes may be in flight at once. With 1 the
+                        disks are deleted one after another.
+        timeout: Seconds allowed for all deletions to finish.
+        inventory: An InventoryStore to record the listed disks in.
+    
+    Returns:
+        A (deleted, failed, still_deleting, not_attempted) tuple: the names of
+        the deleted disks, a dict mapping the name of each disk that could not
+        be deleted to its error, the names of the disks whose delete was still
+        running when the timeout passed (it finishes on its own), and the
+        names of the unattached disks whose delete was never sent because the
+        timeout had passed. With zone 'all' the names are prefixed with the
+        disk's zone.
     """
     
+    deleted, failed, still_deleting, not_attempted = [], {}, [], []
     try:
-        # Initialize the Compute Engine client for the specified zone
+        # Initialize the Compute Engine client
         disks_client = compute_v1.DisksClient()
-        
-        # List all disks in the target project and zone
-        request = compute_v1.ListDisksRequest(project=project_id, zone=zone)
-        disks_list = disks_client.list(request=request)
+    except Exception as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        return deleted, failed, still_deleting, not_attempted
+    
+    # Unattached disks are handed over while the listing is still being paged
+    # through. All pending delete operations are tracked by one waiter; a new
+    # delete is started whenever one finishes, so at most max_concurrent are
+    # in flight, and a failure never stops the others. Once the timeout has
+    # passed no new delete is sent
+    unattached = find_unattached_disks(disks_client, project_id, zone, inventory)
+    waiter = OperationWaiter(timeout=timeout)
+    
+    def start_next():
+        for disk_zone, disk_name in unattached:
+            label = location_label(disk_zone, disk_name, zone == ALL_LOCATIONS)
+            print(f"Attempting to delete disk '{label}'...")
+            try:
+                waiter.add(start_delete(disks_client, project_id, disk_zone, disk_name), label)
+                return
+            except Exception as e:
+                failed[label] = e
+                print(f"Failed to delete disk '{label}': {e}", file=sys.stderr)
+    
+    for _ in range(max(1, max_concurrent)):
+        start_next()
+    for disk_name, error in waiter.as_completed():
+        if isinstance(error, OperationTimeoutError):
+            still_deleting.append(disk_name)
+            print(f"Disk '{disk_name}' is still being deleted.")
+        elif error:
+            failed[disk_name] = error
+            print(f"Failed to delete disk '{disk_name}': {error}", file=sys.stderr)
+        else:
+            deleted.append(disk_name)
+            print(f"Disk '{disk_name}' successfully deleted.")
+        if not still_deleting and time.monotonic() < waiter.deadline:
+            start_next()
+    
+    # The rest of the listing is still read, to report (and record) every disk
+    for disk_zone, disk_name in unattached:
+        not_attempted.append(location_label(disk_zone, disk_name, zone == ALL_LOCATIONS))
+    
+    total = len(deleted) + len(failed) + len(still_deleting) + len(not_attempted)
+    if total:
+        print(f"\nDeleted {len(deleted)} of {total} unattached disks"
+              + (f"; {len(still_deleting)} still being deleted" if still_deleting else "")
+              + (f"; {len(failed)} failed: {', '.join(sorted(failed))}" if failed else "")
+              + (f"; {len(not_attempted)} not attempted (timed out): {', '.join(sorted(not_attempted))}"
+                 if not_attempted else "") + ".")
+    return deleted, failed, still_deleting, not_attempted
+
+def find_unattached_disks(disks_client, project_id: str, zone: str, inventory=None):
+    """
+    Yields (zone, disk name) for every unattached disk in one zone, or in
+    all zones of the project (one aggregated, paged listing) if zone is 'all'.
+    Once the listing is complete, it is recorded in ``inventory`` if given.
+    """
+    all_zones = zone == ALL_LOCATIONS
+    try:
+        if all_zones:
+            request = compute_v1.AggregatedListDisksRequest(
+                project=project_id,
+                max_results=AGGREGATED_PAGE_SIZE,
+                return_partial_success=True,
+            )
+            disks = aggregated_items(list_pages("compute.read", disks_client.aggregated_list, request), "disks", "zones")
+        else:
+            # List all disks in the target project and zone (the pager fetches every page)
+            request = compute_v1.ListDisksRequest(project=project_id, zone=zone)
+            disks = ((zone, disk) for page in list_pages("compute.read", disks_client.list, request)
+                     for disk in page.items)
         
         # Check for unattached disks
-        for disk in disks_list.items:
+        seen = {}
+        for disk_zone, disk in disks:
+            label = location_label(disk_zone, disk.name, all_zones)
+            seen[f"{disk_zone}/{disk.name}"] = {"users": list(disk.users), "size_gb": disk.size_gb}
             # A disk is unattached if the 'users' list is empty
             if not disk.users:
-                print(f"Found unattached disk: {disk.name}. Attempting to delete...")
-                
-                # Create a delete request
-                delete_request = compute_v1.DeleteDiskRequest(
-                    project=project_id,
-                    zone=zone,
-                    disk=disk.name,
-                )
-                
-                # Execute the delete operation and wait for it to complete
-                operation = disks_client.delete(request=delete_request)
-                
-                # Optional: You can implement a function to wait for the operation
-                # to ensure it completes before the script finishes.
-                wait_for_extended_operation(operation, disks_client)
-                
-                print(f"Disk '{disk.name}' successfully deleted.")
+                print(f"Found unattached disk: {label}.")
+                yield disk_zone, disk.name
             else:
-                print(f"Disk '{disk.name}' is in use by: {disk.users}. Skipping.")
-                
+                print(f"Disk '{label}' is in use by: {disk.users}. Skipping.")
+        
+        if inventory:
+            inventory.record("disk", project_id, zone, seen)
+    
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
-        
-def wait_for_extended_operation(operation, client):
-    """Waits for an extended operation to complete."""
-    while operation.status != "DONE":
-        # Refresh the operation status
-        operation = client.get_zone_operation(
-            project=operation.target_link.split('/')[6],
-            zone=operation.target_link.split('/')[8],
-            operation=operation.name,
-        )
-    if operation.error:
-        raise Exception(f"Operation failed with error: {operation.error}")
+
+def start_delete(disks_client, project_id: str, zone: str, disk_name: str):
+    """Starts deleting one disk and returns the delete operation."""
+    # Create a delete request
+    delete_request = compute_v1.DeleteDiskRequest(
+        project=project_id,
+        zone=zone,
+        disk=disk_name,
+    )
+    
+    # Execute the delete operation; its completion is tracked by the caller
+    return call("compute.write", disks_client.delete, request=delete_request)
 
 if __name__ == "__main__":
     # Get variables from environment
     project_id = os.environ.get("GCP_PROJECT_ID")
     zone = os.environ.get("GCP_ZONE")
-
+    max_concurrent = os.environ.get("MAX_CONCURRENT_DELETES", "1")
+    timeout = os.environ.get("OPERATION_TIMEOUT", str(DEFAULT_TIMEOUT))
+    
+    try:
+        inventory = open_inventory()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
     if not project_id or not zone:
-        print("Error: GCP_PROJECT_ID and GCP_ZONE environment variables must be set.")
+        print("Error: GCP_PROJECT_ID and GCP_ZONE environment variables must be set "
+              f"(GCP_ZONE='{ALL_LOCATIONS}' covers every zone).")
+        sys.exit(1)
+    
+    if not max_concurrent.isdigit() or int(max_concurrent) < 1:
+        print("Error: MAX_CONCURRENT_DELETES must be a positive integer.")
         sys.exit(1)
     
-    print(f"Starting disk cleanup for project '{project_id}' in zone '{zone}'...")
-    delete_unused_disks(project_id, zone)
+    if not timeout.isdigit():
+        print("Error: OPERATION_TIMEOUT must be a number of seconds.")
+        sys.exit(1)
+    
+    where = "all zones" if zone == ALL_LOCATIONS else f"zone '{zone}'"
+    print(f"Starting disk cleanup for project '{project_id}' in {where}...")
+    deleted, failed, still_deleting, not_attempted = delete_unused_disks(project_id, zone, int(max_concurrent), int(timeout), inventory)
+    if inventory:
+        inventory.print_changes()
+    print_stats()
+    if failed or not_attempted:
+        sys.exit(1)
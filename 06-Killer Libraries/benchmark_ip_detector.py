@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Duplicate IP Detector Benchmark
+===============================
+
+Measures duplicate_ip_detector.py on synthetic logs (see
+generate_ip_logs.py) for every parsing mode and log size: lines/s, MB/s,
+peak RSS and report latency (text report + CSV). Each case runs in a fresh
+interpreter so peak memory is not inherited from earlier cases.
+
+Results are appended to a JSON history file, and every run is compared with
+the previous one in that file (or a labelled one), so a slowdown between
+versions shows up as a flagged regression.
+
+Usage:
+    python3 benchmark_ip_detector.py [options]
+
+Examples:
+    python3 benchmark_ip_detector.py
+    python3 benchmark_ip_detector.py --sizes 100MB,1GB --modes mmap,numpy,workers --repeat 3
+    python3 benchmark_ip_detector.py --label before-refactor
+    python3 benchmark_ip_detector.py --compare before-refactor --threshold 5
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import List
+
+from generate_ip_logs import generate_log, parse_size
+
+BASE = Path(__file__).parent
+
+# Mode name -> detector settings; every mode runs against the same logs
+MODES = {
+    'python': {'engine': 'python'},
+    'mmap': {'engine': 'mmap'},
+    'numpy': {'engine': 'numpy'},
+    'compact': {'engine': 'mmap', 'storage': 'compact'},
+    'approximate': {'engine': 'mmap', 'approximate': True},
+    'workers': {'engine': 'mmap', 'workers': min(os.cpu_count() or 1, 4)},
+    'fields': {'engine': 'mmap', 'format': 'apache', 'fields': True},
+}
+
+
+def run_case(case: dict) -> dict:
+    """Scan one log with one mode in this process and return its measurements."""
+    import duplicate_ip_detector as detector_module
+
+    approximate = case.get('approximate', False)
+    detector = detector_module.IPDetector(
+        case.get('format', 'generic'), case['engine'], track_lines=not approximate,
+        storage=case.get('storage', 'dict'), approximate=approximate, fields=case.get('fields', False))
+    output = io.StringIO()
+    try:
+        with tempfile.TemporaryDirectory() as tmp, redirect_stdout(output):
+            started = time.perf_counter()
+            detector.process_log_files([case['logfile']], 'utf-8', case.get('workers', 1))
+            scanned = time.perf_counter()
+            detector.print_report(min_count=2, top_n=20)
+            detector.save_report(os.path.join(tmp, 'report.csv'), min_count=2)
+            reported = time.perf_counter()
+    except SystemExit:
+        # The detector reports errors on stdout before exiting
+        sys.stderr.write(output.getvalue())
+        raise
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'lines': detector.total_lines,
+        'scan_s': scanned - started,
+        'report_s': reported - scanned,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2,
+        'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1024 ** 2,
+    }
+
+
+def measure(mode: str, logfile: Path, repeat: int) -> dict:
+    """Run ``mode`` on ``logfile`` ``repeat`` times in subprocesses; keep the median run."""
+    case = dict(MODES[mode], logfile=str(logfile))
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--run-case', json.dumps(case)],
+                                   cwd=BASE, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"mode {mode} failed: {completed.stderr.strip() or completed.stdout.strip()}")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    run = sorted(runs, key=lambda r: r['scan_s'])[len(runs) // 2]
+    size = logfile.stat().st_size
+    return dict(run, mode=mode, bytes=size,
+                lines_per_s=run['lines'] / run['scan_s'],
+                mb_per_s=size / 1024 ** 2 / run['scan_s'],
+                scan_s_spread=max(r['scan_s'] for r in runs) - min(r['scan_s'] for r in runs))
+
+
+def ensure_log(data_dir: Path, size: int, ips: int, skew: float, seed: int) -> Path:
+    """Path of the synthetic log for these parameters, generating it on first use."""
+    logfile = data_dir.resolve() / f"synthetic_{format_size(size)}_{ips}ips_zipf{skew}_seed{seed}.log"
+    if not logfile.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        print(f"📝 Generating {logfile.name} ...")
+        partial = logfile.with_suffix('.partial')
+        generate_log(str(partial), size=size, ips=ips, skew=skew, seed=seed)
+        partial.rename(logfile)
+    return logfile
+
+
+def format_size(size: int) -> str:
+    """Short size label such as '10MB' or '1GB'."""
+    for unit, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+        if size >= factor:
+            return f"{size / factor:g}{unit}"
+    return f"{size}B"
+
+
+def git_revision() -> str:
+    """Short commit hash of the checkout being measured, if it is a git repo."""
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE,
+                                   capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def load_history(results_file: Path) -> List[dict]:
+    """Earlier benchmark runs saved in ``results_file`` (empty if it does not exist)."""
+    if not results_file.exists():
+        return []
+    with open(results_file) as f:
+        return json.load(f)
+
+
+def print_results(results: List[dict], baseline: dict, threshold: float) -> int:
+    """Print the results table, comparing throughput with ``baseline``; return the regression count."""
+    previous = {}
+    if baseline:
+        previous = {(r['mode'], r['size']): r for r in baseline['results']}
+        print(f"📊 Compared with run '{baseline['label']}' ({baseline['timestamp']}, {baseline.get('commit') or '-'})")
+    print("-" * 92)
+    print(f"{'Mode':<12} {'Size':>7} {'Lines/s':>12} {'MB/s':>9} {'Peak RSS':>10} {'Workers':>9} "
+          f"{'Report':>9}  {'vs baseline':>14}")
+    print("-" * 92)
+    regressions = 0
+    for r in results:
+        change = ""
+        before = previous.get((r['mode'], r['size']))
+        if before:
+            delta = (r['lines_per_s'] / before['lines_per_s'] - 1) * 100
+            change = f"{delta:+.1f}%"
+            if delta < -threshold:
+                change += " ⚠️"
+                regressions += 1
+        workers = f"{r['worker_rss_mb']:,.0f} MB" if r['worker_rss_mb'] else "-"
+        print(f"{r['mode']:<12} {r['size']:>7} {r['lines_per_s']:>12,.0f} {r['mb_per_s']:>9,.1f} "
+              f"{r['peak_rss_mb']:>7,.0f} MB {workers:>9} {r['report_s'] * 1000:>6,.0f} ms  {change:>14}")
+    print("-" * 92)
+    if regressions:
+        print(f"⚠️  {regressions} case(s) more than {threshold:g}% slower than the baseline")
+    return regressions
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark duplicate_ip_detector.py on synthetic logs',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s
+  %(prog)s --sizes 100MB,1GB --modes mmap,numpy,workers --repeat 3
+  %(prog)s --label before-refactor
+  %(prog)s --compare before-refactor --threshold 5
+        """
+    )
+    parser.add_argument('--sizes', default='10MB,100MB',
+                        help='Comma-separated log sizes to benchmark (default: 10MB,100MB)')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help=f"Comma-separated modes (default: all of {','.join(MODES)})")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per case; the median is reported (default: 1)')
+    parser.add_argument('--ips', type=int, default=100000,
+                        help='Distinct IPs in the generated logs (default: 100000)')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent of IP frequencies (default: 1.1)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated logs (default: 42)')
+    parser.add_argument('--data-dir', type=Path, default=BASE / 'bench_data',
+                        help='Where generated logs are kept and reused (default: bench_data/)')
+    parser.add_argument('--results', type=Path, default=BASE / 'bench_results.json',
+                        help='JSON history the results are appended to (default: bench_results.json)')
+    parser.add_argument('--label', help='Name for this run in the history (default: git commit or time)')
+    parser.add_argument('--compare', metavar='LABEL',
+                        help='Compare with this labelled run instead of the previous one')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Flag cases this many percent slower than the baseline (default: 10)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(',')]
+    except ValueError as e:
+        parser.error(f"--sizes: {e}")
+    modes = [mode.strip() for mode in args.modes.split(',')]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s) {', '.join(unknown)} (choose from {', '.join(MODES)})")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if 'numpy' in modes:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            print("⚠️  NumPy is not installed; skipping the numpy mode")
+            modes.remove('numpy')
+
+    history = load_history(args.results)
+    baseline = history[-1] if history else None
+    if args.compare:
+        labelled = [run for run in history if run['label'] == args.compare]
+        if not labelled:
+            parser.error(f"no run labelled '{args.compare}' in {args.results}")
+        baseline = labelled[-1]
+
+    results = []
+    for size in sizes:
+        logfile = ensure_log(args.data_dir, size, args.ips, args.skew, args.seed)
+        for mode in modes:
+            print(f"⏱️  {mode} on {logfile.name} ...", flush=True)
+            try:
+                result = measure(mode, logfile, args.repeat)
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            results.append(dict(result, size=format_size(size)))
+
+    commit = git_revision()
+    run = {
+        'label': args.label or commit or time.strftime('%Y%m%d-%H%M%S'),
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {'ips': args.ips, 'skew': args.skew, 'seed': args.seed, 'repeat': args.repeat},
+        'results': results,
+    }
+    print()
+    print_results(results, baseline, args.threshold)
+    with open(args.results, 'w') as f:
+        json.dump(history + [run], f, indent=2)
+    print(f"📁 Results saved to: {args.results} (run '{run['label']}')")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,19 +8,779 @@ Supports various log formats and provides detailed analysis.
 
 Usage:
     python3 duplicate_ip_detector.py <logfile> [options]
+    python3 duplicate_ip_detector.py merge <statefile> ... [options]
     
 Examples:
     python3 duplicate_ip_detector.py access.log
     python3 duplicate_ip_detector.py --min-count 5 --format apache access.log
     python3 duplicate_ip_detector.py --output duplicates.txt server.log
+    python3 duplicate_ip_detector.py --workers 8 huge_access.log
+    python3 duplicate_ip_detector.py --engine mmap huge_access.log
+    python3 duplicate_ip_detector.py --storage compact --show-lines huge_access.log
+    python3 duplicate_ip_detector.py --approximate --top 20 edge_node.log
+    python3 duplicate_ip_detector.py --follow --windows 1m,15m --interval 30 access.log
+    python3 duplicate_ip_detector.py --state access.state.json access.log
+    python3 duplicate_ip_detector.py --workers 4 /var/log/nginx/ 'archive/access.log.*.gz'
+    python3 duplicate_ip_detector.py --engine numpy --top 20 huge_access.log
+    python3 duplicate_ip_detector.py --ipv6 --subnets 24,16 --subnets6 64 access.log
+    python3 duplicate_ip_detector.py --allowlist our_lbs.txt --denylist tor_exits.txt access.log
+    python3 duplicate_ip_detector.py merge web1.ipstate web2.ipstate --top 20
+    python3 duplicate_ip_detector.py --build-index access.log
+    python3 duplicate_ip_detector.py --lookup 192.168.1.1 access.log
+    python3 duplicate_ip_detector.py --format apache --fields --top 20 access.log
+    python3 duplicate_ip_detector.py --profile --stats-json run.json huge_access.log
+
+Library use (raises exceptions instead of exiting):
+    detector = IPDetector('nginx')
+    for ip, line_num in detector.scan_stream(lines_or_byte_chunks):
+        ...
+    detector.snapshot(top_n=10)
 """
 
+import bz2
+import calendar
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import ipaddress
+import json
+import lzma
+import math
+import mmap
+import os
 import re
 import argparse
+import asyncio
+import socket
+import struct
 import sys
-from collections import Counter, defaultdict
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict, deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from itertools import accumulate, chain
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Tuple, Set
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List, Dict, Tuple, Set, Union
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional and only used by the numpy engine
+    np = None
+
+try:
+    import resource
+except ImportError:  # Unix only; --profile then leaves out peak memory
+    resource = None
+
+# Upper bound on the bytes a single worker parses at once in --workers mode.
+# Files larger than workers * CHUNK_BYTES are split into more chunks than
+# workers so each process only holds one moderately sized chunk in memory.
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Size of the blocks the mmap engine hands to the regex engine at a time.
+# Blocks end on a newline so no match is ever split between two blocks.
+SCAN_BLOCK_BYTES = 16 * 1024 * 1024
+
+ENGINES = ['python', 'mmap', 'numpy']
+
+# The bytes engines (mmap, numpy) end lines only at '\n'. The python engine
+# reads with universal newlines and also ends them at a bare '\r', so logs
+# with bare '\r' line endings are refused by the bytes engines rather than
+# reported with different line numbers.
+_BARE_CR = re.compile(rb'\r(?!\n)')
+STORAGES = ['dict', 'compact']
+
+# In --approximate mode hits are staged in a small exact Counter and folded
+# into the sketches whenever it holds this many distinct IPs.
+APPROX_FLUSH_KEYS = 1 << 16
+
+# Checkpoint files (--state) record this version; older or newer files are
+# ignored and the log is re-scanned from the start.
+CHECKPOINT_VERSION = 1
+
+# Binary state files (--export-state, merge) start with this magic and
+# format version; files of another version are rejected.
+STATE_MAGIC = b'IPDSTATE'
+STATE_FORMAT_VERSION = 1
+# Format version and JSON header length, then per IP: count, number of
+# line numbers and key length, followed by the key and the line numbers
+_STATE_HEAD = struct.Struct('<HI')
+_STATE_RECORD = struct.Struct('<QIB')
+
+# Line index files (--build-index, --lookup) live next to their log with
+# this suffix. After the magic and head come a JSON header, a directory of
+# fixed-size entries sorted by key (17-byte big-endian pack_ip key, offset
+# and length of its postings) and the postings: the byte offsets of the
+# lines each IP appears on, as little-endian uint64.
+INDEX_SUFFIX = '.ipidx'
+INDEX_MAGIC = b'IPDINDEX'
+INDEX_FORMAT_VERSION = 1
+_INDEX_HEAD = struct.Struct('<HIQ')
+_INDEX_ENTRY = struct.Struct('<17sQI')
+
+# Bytes hashed at the start of the log and just before the checkpoint
+# offset to recognise a log that was replaced or rewritten.
+FINGERPRINT_BYTES = 4096
+
+# Compact storage keys IPv6 addresses as their 128-bit value plus this
+# offset, so they never collide with the uint32 keys of IPv4 addresses.
+IPV6_KEY_OFFSET = 1 << 32
+
+# scan_stream/ascan_stream hand their input to the detector in batches of
+# at most this many items (lines or chunks) or bytes, so memory stays
+# bounded however long the stream runs.
+STREAM_BATCH_ITEMS = 10000
+STREAM_BATCH_BYTES = 1024 * 1024
+
+# The python engine reads lines in batches of about this many characters
+# when a profiler tracks its progress, and the progress bar is redrawn at
+# most once per PROGRESS_INTERVAL seconds.
+PROGRESS_READ_CHARS = 1024 * 1024
+PROGRESS_INTERVAL = 0.25
+
+# Compressed logs are recognised by extension and decompressed as a stream
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+}
+
+
+def pack_ipv4(ip: str) -> int:
+    """Pack a dotted-quad IPv4 address into a uint32."""
+    a, b, c, d = map(int, ip.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def unpack_ipv4(key: int) -> str:
+    """Turn a uint32 produced by pack_ipv4 back into a dotted quad."""
+    return f"{key >> 24}.{(key >> 16) & 255}.{(key >> 8) & 255}.{key & 255}"
+
+
+def canonical_ipv6(ip: str) -> str:
+    """Compressed form of an IPv6 address, or None if it is not valid.
+    
+    IPv4-mapped addresses (``::ffff:10.0.0.1``, as logged by dual-stack
+    servers) are returned as the plain dotted quad.
+    """
+    try:
+        address = ipaddress.IPv6Address(ip)
+    except ValueError:
+        return None
+    return str(address.ipv4_mapped or address)
+
+
+def pack_ip(ip: str) -> int:
+    """Pack an IPv4 or IPv6 address into the integer keys of compact storage."""
+    if ':' in ip:
+        return IPV6_KEY_OFFSET + int(ipaddress.IPv6Address(ip))
+    return pack_ipv4(ip)
+
+
+def unpack_ip(key: int) -> str:
+    """Turn a key produced by pack_ip back into an address string."""
+    if key < IPV6_KEY_OFFSET:
+        return unpack_ipv4(key)
+    return str(ipaddress.IPv6Address(key - IPV6_KEY_OFFSET))
+
+
+def parse_network(text: str) -> Tuple[int, int]:
+    """First and last pack_ip key covered by an address or CIDR block.
+    
+    Addresses are parsed with ``socket.inet_pton`` rather than the ipaddress
+    module, since network lists can hold hundreds of thousands of entries.
+    Host bits set below the prefix are ignored. Raises ValueError for
+    invalid input.
+    """
+    address, slash, length = text.partition('/')
+    family, width, offset = ((socket.AF_INET6, 128, IPV6_KEY_OFFSET) if ':' in address
+                             else (socket.AF_INET, 32, 0))
+    try:
+        key = int.from_bytes(socket.inet_pton(family, address), 'big')
+    except OSError:
+        raise ValueError(f"'{text}' is not an IP address or CIDR block") from None
+    if slash and not (length.isdigit() and int(length) <= width):
+        raise ValueError(f"'{text}' has an invalid prefix length")
+    host_bits = width - int(length) if slash else 0
+    first = offset + (key >> host_bits << host_bits)
+    return first, first + (1 << host_bits) - 1
+
+
+def read_networks(filepath: str) -> Iterable[Tuple[int, int]]:
+    """Yield the key ranges listed in a file of addresses and CIDR blocks.
+    
+    One entry per line; blank lines and ``#`` comments are skipped. Raises
+    ValueError naming the file and line of the first invalid entry.
+    """
+    with open(filepath) as f:
+        for line_num, line in enumerate(f, 1):
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            try:
+                yield parse_network(entry)
+            except ValueError as e:
+                raise ValueError(f"{filepath}:{line_num}: {e}") from None
+
+
+class RangeIndex:
+    """Set of IP ranges with O(log n) membership tests on pack_ip keys.
+    
+    Overlapping and adjacent ranges are merged when the index is built, so
+    a lookup is a single ``bisect`` over the sorted range starts, however
+    many CIDR blocks went in.
+    """
+    
+    def __init__(self, ranges: Iterable[Tuple[int, int]]):
+        self._starts, self._ends = [], []
+        for first, last in sorted(ranges):
+            if self._ends and first <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], last)
+            else:
+                self._starts.append(first)
+                self._ends.append(last)
+    
+    @classmethod
+    def from_files(cls, filepaths: List[str]) -> 'RangeIndex':
+        """Build one index from the networks listed in several files."""
+        return cls(chain.from_iterable(map(read_networks, filepaths)))
+    
+    def __contains__(self, key: int) -> bool:
+        index = bisect_right(self._starts, key) - 1
+        return index >= 0 and key <= self._ends[index]
+    
+    def __len__(self) -> int:
+        return len(self._starts)
+    
+    def fingerprint(self) -> str:
+        """Short hash of the merged ranges, to tell whether two indexes match."""
+        data = json.dumps([self._starts, self._ends]).encode('ascii')
+        return hashlib.sha256(data).hexdigest()[:16]
+
+
+class PackedIPView(Mapping):
+    """Read-only view of a uint32-keyed store that is keyed by IP strings.
+    
+    The compact storage backend keeps its counters keyed by packed ints; this
+    view lets ``get_duplicates``, ``print_report`` and other readers use it
+    exactly like the default ``{ip: value}`` dictionaries.
+    """
+    
+    def __init__(self, data):
+        self._data = data
+    
+    def __getitem__(self, ip):
+        try:
+            key = pack_ip(ip)
+        except (AttributeError, ValueError):
+            raise KeyError(ip) from None
+        return self._data[key]
+    
+    def __iter__(self):
+        return map(unpack_ip, self._data)
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def items(self):
+        return [(unpack_ip(key), value) for key, value in self._data.items()]
+    
+    def values(self):
+        return self._data.values()
+
+
+class _CandidateCache(dict):
+    """Map raw candidate bytes to a counter key, resolving each one only once.
+    
+    Lookups are plain dict hits, so they can run inside C-level ``map``
+    loops; ``__missing__`` calls ``resolve`` the first time a candidate is
+    seen and stores the result (``None`` for invalid addresses). With a
+    ``limit`` the cache is emptied whenever it grows past that many entries.
+    """
+    
+    def __init__(self, resolve, limit: int = None):
+        super().__init__()
+        self.resolve = resolve
+        self.limit = limit
+    
+    def __missing__(self, candidate):
+        if self.limit and len(self) >= self.limit:
+            self.clear()
+        key = self[candidate] = self.resolve(candidate)
+        return key
+
+
+def _hash64(key) -> int:
+    """Stable 64-bit hash of a counter key (IP string or packed int).
+    
+    Python's built-in ``hash`` is salted per process, which would make
+    sketches built in different worker processes impossible to merge.
+    """
+    if isinstance(key, int):
+        # IPv6 keys of compact storage need a 17th byte
+        data = key.to_bytes(max(16, (key.bit_length() + 7) // 8), 'big')
+    else:
+        data = key.encode('ascii')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary holding at most ``capacity`` counters.
+    
+    The summary is updated with exact counts for whole batches of the stream
+    and merged like the mergeable form of Space-Saving: counters are added,
+    an IP missing from a full summary is assumed to have up to that
+    summary's smallest count, and only the ``capacity`` largest are kept.
+    Every tracked count is an overestimate: the true count lies between
+    ``count - error`` and ``count``.
+    """
+    
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+    
+    def update(self, counts: Mapping) -> None:
+        """Fold in exact counts for the next batch of the stream."""
+        self._combine(counts, {}, 0, sum(counts.values()))
+    
+    def merge(self, other: 'SpaceSaving') -> None:
+        """Combine with a summary of another stream, keeping upper bounds valid."""
+        self._combine(other.counts, other.errors, other.min_count(), other.total)
+    
+    def _combine(self, counts: Mapping, errors: Mapping, floor: int, total: int) -> None:
+        own_floor = self.min_count()
+        merged_counts, merged_errors = {}, {}
+        for key in dict.fromkeys(chain(self.counts, counts)):
+            merged_counts[key] = self.counts.get(key, own_floor) + counts.get(key, floor)
+            merged_errors[key] = self.errors.get(key, own_floor) + errors.get(key, floor)
+        
+        kept = heapq.nlargest(self.capacity, merged_counts, key=merged_counts.__getitem__)
+        self.counts = {key: merged_counts[key] for key in kept}
+        self.errors = {key: merged_errors[key] for key in kept}
+        self.total += total
+    
+    def min_count(self) -> int:
+        """Smallest tracked count when the summary is full, else 0."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+    
+    def max_error(self) -> int:
+        """Upper bound on the overestimate of any reported count."""
+        return max(self.errors.values(), default=0)
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality estimator using 2**precision one-byte registers."""
+    
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+    
+    def add(self, key) -> None:
+        """Record one (possibly repeated) key."""
+        h = _hash64(key)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def estimate(self) -> int:
+        """Estimated number of distinct keys added."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+    
+    def relative_error(self) -> float:
+        """Standard error of ``estimate`` as a fraction of the true value."""
+        return 1.04 / math.sqrt(len(self.registers))
+    
+    def merge(self, other: 'HyperLogLog') -> None:
+        """Fold in the registers of an estimator with the same precision."""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+class PrefixTrie:
+    """Compressed binary trie (radix tree) of per-address counts.
+    
+    Addresses are ``width``-bit integers (32 for IPv4, 128 for IPv6). Every
+    node covers a run of the sorted addresses that share a prefix, so its
+    total count and number of addresses come straight from prefix sums.
+    Chains of single-child nodes are collapsed, so n addresses need fewer
+    than 2n nodes. Nodes live in flat lists rather than objects, which
+    keeps building a trie over millions of addresses cheap. The trie is
+    built once from the counts of a single pass; ``subnets`` then rolls
+    them up to any prefix length by visiting only the nodes above it.
+    """
+    
+    def __init__(self, counts: Mapping, width: int = 32):
+        self.width = width
+        self._keys = keys = sorted(counts)
+        # _totals[i] is the summed count of the i smallest addresses
+        self._totals = list(accumulate((counts[key] for key in keys), initial=0))
+        # Node i covers keys[_lo[i]:_hi[i]], which share their first _length[i]
+        # bits; inner nodes have two children, leaves have child index 0
+        self._lo, self._hi, self._length = [], [], []
+        self._left, self._right = [], []
+        if keys:
+            self._build()
+    
+    def _add_node(self, lo: int, hi: int) -> int:
+        self._lo.append(lo)
+        self._hi.append(hi)
+        self._length.append(self.width - (self._keys[lo] ^ self._keys[hi - 1]).bit_length())
+        self._left.append(0)
+        self._right.append(0)
+        return len(self._lo) - 1
+    
+    def _build(self) -> None:
+        keys = self._keys
+        stack = [self._add_node(0, len(keys))]
+        while stack:
+            node = stack.pop()
+            lo, hi = self._lo[node], self._hi[node]
+            if hi - lo > 1:
+                # The addresses split on the bit after the common prefix
+                shift = self.width - self._length[node] - 1
+                mid = bisect_left(keys, ((keys[lo] >> shift) | 1) << shift, lo, hi)
+                self._left[node] = self._add_node(lo, mid)
+                self._right[node] = self._add_node(mid, hi)
+                stack.append(self._left[node])
+                stack.append(self._right[node])
+    
+    def subnets(self, length: int) -> Iterable[Tuple[int, int, int]]:
+        """Yield (prefix, total, addresses) for every /length subnet with hits, in address order."""
+        if not 0 <= length <= self.width:
+            raise ValueError(f"prefix length must be between 0 and {self.width}")
+        keys, totals = self._keys, self._totals
+        stack = [0] if keys else []
+        while stack:
+            node = stack.pop()
+            node_length = self._length[node]
+            if node_length >= length:
+                # Every address below the node shares its first ``length`` bits
+                lo, hi = self._lo[node], self._hi[node]
+                yield keys[lo] >> (self.width - length), totals[hi] - totals[lo], hi - lo
+            else:
+                stack.append(self._right[node])
+                stack.append(self._left[node])
+    
+    def top(self, length: int, n: int, min_total: int = 1) -> List[Tuple[int, int, int]]:
+        """The n /length subnets with the highest totals (lowest address first on ties)."""
+        subnets = (subnet for subnet in self.subnets(length) if subnet[1] >= min_total)
+        return heapq.nlargest(n, subnets, key=itemgetter(1))
+    
+    def network(self, prefix: int, length: int) -> str:
+        """CIDR notation for a prefix returned by ``subnets``."""
+        network_class = ipaddress.IPv4Network if self.width == 32 else ipaddress.IPv6Network
+        return str(network_class((prefix << (self.width - length), length)))
+
+
+_MONTHS = {name: number for number, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+
+def parse_clf_timestamp(text: str) -> float:
+    """Seconds since the epoch for a log timestamp like '25/Dec/2024:10:00:01 +0000'.
+    
+    The UTC offset is optional (UTC is assumed). Parsed by hand because
+    ``strptime`` is far too slow to run on every line of a big log.
+    """
+    day, month, rest = text.split('/', 2)
+    year, hours, minutes, rest = rest.split(':', 3)
+    seconds, _, zone = rest.partition(' ')
+    timestamp = calendar.timegm((int(year), _MONTHS[month], int(day), int(hours), int(minutes), int(seconds)))
+    if zone:
+        offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+        timestamp -= offset if zone[0] == '+' else -offset
+    return float(timestamp)
+
+
+class FieldAggregates:
+    """Per-IP aggregates of combined-log fields, stored as columns.
+    
+    Every IP gets a row number in first-seen order and each aggregate is an
+    array indexed by row (a struct of arrays), so an IP costs a few machine
+    words per column instead of a dict of Python objects. Status codes and
+    methods get one count column each; distinct paths are kept as a single
+    set of ``row << 32 | path id`` integers.
+    """
+    
+    def __init__(self):
+        self.rows = {}
+        self.bytes = array('Q')
+        self.first_seen = array('d')
+        self.last_seen = array('d')
+        self.statuses = {}
+        self.methods = {}
+        self._path_ids = {}
+        self._row_paths = set()
+        self._distinct_paths = None
+        self._last_timestamp = (None, None)
+    
+    def _row(self, key) -> int:
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.rows)
+            self.bytes.append(0)
+            self.first_seen.append(math.inf)
+            self.last_seen.append(-math.inf)
+        return row
+    
+    def _bump(self, columns: dict, name, row: int, count: int = 1) -> None:
+        column = columns.get(name)
+        if column is None:
+            column = columns[name] = array('I')
+        if len(column) <= row:
+            # Columns only grow when a row first needs them
+            column.extend(array('I', [0]) * (len(self.rows) - len(column)))
+        column[row] += count
+    
+    def _see(self, row: int, first: float, last: float) -> None:
+        if first < self.first_seen[row]:
+            self.first_seen[row] = first
+        if last > self.last_seen[row]:
+            self.last_seen[row] = last
+    
+    def _add_path(self, row: int, path: str) -> None:
+        path_id = self._path_ids.setdefault(path, len(self._path_ids))
+        self._row_paths.add(row << 32 | path_id)
+        self._distinct_paths = None
+    
+    def add(self, key, timestamp: str, method: str, path: str, status: str, size: str) -> None:
+        """Record one request parsed from a combined-log line."""
+        row = self._row(key)
+        if size != '-':
+            self.bytes[row] += int(size)
+        # Consecutive lines usually share their timestamp
+        if timestamp != self._last_timestamp[0]:
+            try:
+                self._last_timestamp = (timestamp, parse_clf_timestamp(timestamp))
+            except (ValueError, KeyError, IndexError):
+                self._last_timestamp = (timestamp, None)
+        seconds = self._last_timestamp[1]
+        if seconds is not None:
+            self._see(row, seconds, seconds)
+        self._bump(self.statuses, int(status), row)
+        self._bump(self.methods, method, row)
+        self._add_path(row, path)
+    
+    def merge(self, other: 'FieldAggregates') -> None:
+        """Fold in the aggregates of another detector, matching rows by key."""
+        row_map = [self._row(key) for key in other.rows]
+        for other_row, row in enumerate(row_map):
+            self.bytes[row] += other.bytes[other_row]
+            self._see(row, other.first_seen[other_row], other.last_seen[other_row])
+        for columns, other_columns in ((self.statuses, other.statuses), (self.methods, other.methods)):
+            for name, column in other_columns.items():
+                for other_row, count in enumerate(column):
+                    if count:
+                        self._bump(columns, name, row_map[other_row], count)
+        paths = list(other._path_ids)
+        for pair in other._row_paths:
+            self._add_path(row_map[pair >> 32], paths[pair & 0xFFFFFFFF])
+    
+    def distinct_paths(self, row: int) -> int:
+        if self._distinct_paths is None:
+            counts = array('I', [0]) * len(self.rows)
+            for pair in self._row_paths:
+                counts[pair >> 32] += 1
+            self._distinct_paths = counts
+        return self._distinct_paths[row]
+    
+    def summary(self, key) -> dict:
+        """The aggregates of one IP (by counter key), or None if it had no combined-log lines."""
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        
+        def histogram(columns):
+            counts = {name: column[row] for name, column in columns.items() if row < len(column) and column[row]}
+            return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+        
+        return {
+            'statuses': histogram(self.statuses),
+            'methods': histogram(self.methods),
+            'bytes': self.bytes[row],
+            'distinct_paths': self.distinct_paths(row),
+            'first_seen': self.first_seen[row] if self.first_seen[row] != math.inf else None,
+            'last_seen': self.last_seen[row] if self.last_seen[row] != -math.inf else None,
+        }
+
+
+class PipelineProfiler:
+    """Wall/CPU time per pipeline stage, throughput, peak memory and a progress bar.
+    
+    Stages are timed with the ``stage`` context manager and may nest; a
+    nested stage is recorded as 'outer.inner'. CPU time includes worker
+    processes that have finished, so a scan whose CPU time is well below
+    its wall time was waiting on I/O rather than parsing. ``timed`` wraps a
+    frequently called function (such as candidate validation) with a
+    cheaper wall-time-only timer.
+    
+    Scanners report the input bytes they consume through ``advance``; when
+    ``show_progress`` is set and stderr is a terminal, a progress bar is
+    redrawn at most every PROGRESS_INTERVAL seconds.
+    """
+    
+    def __init__(self, total_bytes: int = 0, show_progress: bool = False):
+        self.total_bytes = total_bytes
+        self.bytes_done = 0
+        self.show_progress = show_progress and sys.stderr.isatty()
+        self.stages = {}
+        self._stack = []
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._last_draw = 0.0
+    
+    @staticmethod
+    def _cpu_time() -> float:
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+    
+    def _entry(self, name: str) -> dict:
+        # Stages are listed in the order they were first entered, parents first
+        return self.stages.get(name) or self.stages.setdefault(name, {'wall_s': 0.0, 'calls': 0})
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage ``name`` (nested under the current stage)."""
+        self._stack.append(name)
+        stage = self._entry('.'.join(self._stack))
+        wall, cpu = time.perf_counter(), self._cpu_time()
+        try:
+            yield
+        finally:
+            stage['wall_s'] += time.perf_counter() - wall
+            stage['cpu_s'] = stage.get('cpu_s', 0.0) + self._cpu_time() - cpu
+            stage['calls'] += 1
+            self._stack.pop()
+    
+    def timed(self, name: str, function: Callable) -> Callable:
+        """Wrap ``function`` so its wall time is added to stage ``name`` under the current stage."""
+        clock = time.perf_counter
+        
+        def wrapper(*args):
+            started = clock()
+            try:
+                return function(*args)
+            finally:
+                stage = self._entry('.'.join(self._stack + [name]))
+                stage['wall_s'] += clock() - started
+                stage['calls'] += 1
+        return wrapper
+    
+    def advance(self, nbytes: int) -> None:
+        """Record ``nbytes`` more input consumed, redrawing the progress bar if it is due."""
+        self.bytes_done += nbytes
+        if self.show_progress:
+            now = time.perf_counter()
+            if now - self._last_draw >= PROGRESS_INTERVAL:
+                self._last_draw = now
+                self._draw(now)
+    
+    def _draw(self, now: float) -> None:
+        elapsed = max(now - self._started, 1e-9)
+        rate = self.bytes_done / elapsed
+        done = min(self.bytes_done / self.total_bytes, 1.0) if self.total_bytes else 0.0
+        filled = int(done * 30)
+        eta = f"ETA {(self.total_bytes - self.bytes_done) / rate:,.0f}s" if rate and done < 1 else ""
+        sys.stderr.write(f"\r⏳ [{'#' * filled}{'.' * (30 - filled)}] {done:6.1%}  "
+                         f"{self.bytes_done / 1024 ** 2:,.1f}/{self.total_bytes / 1024 ** 2:,.1f} MB  "
+                         f"{rate / 1024 ** 2:,.1f} MB/s  {eta}   ")
+        sys.stderr.flush()
+    
+    def finish_progress(self) -> None:
+        """Clear the progress bar once scanning is over."""
+        if self.show_progress and self._last_draw:
+            sys.stderr.write("\r" + " " * 100 + "\r")
+            sys.stderr.flush()
+    
+    @staticmethod
+    def peak_memory() -> Tuple[int, int]:
+        """Peak resident memory in bytes of this process and of its largest worker (None if unknown)."""
+        if resource is None:
+            return None, None
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+    
+    def summary(self, detector: 'IPDetector') -> dict:
+        """Stage timings, throughput and peak memory of a finished run, ready for JSON."""
+        stats = detector.get_statistics()
+        scan_s = self.stages.get('scan', {}).get('wall_s') or 0.0
+        peak, worker_peak = self.peak_memory()
+        
+        def per_second(amount):
+            return round(amount / scan_s, 1) if scan_s else None
+        
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started_at)),
+            'wall_s': round(time.perf_counter() - self._started, 6),
+            'stages': {name: {key: round(value, 6) if key != 'calls' else value for key, value in stage.items()}
+                       for name, stage in self.stages.items()},
+            'bytes': self.bytes_done,
+            'lines': stats['total_lines'],
+            'hits': stats['total_ip_occurrences'],
+            'unique_ips': stats['unique_ips'],
+            'lines_per_s': per_second(stats['total_lines']),
+            'hits_per_s': per_second(stats['total_ip_occurrences']),
+            'bytes_per_s': per_second(self.bytes_done),
+            'peak_rss_bytes': peak,
+            # Only worker processes (whose results get merged) count as children
+            'worker_peak_rss_bytes': worker_peak if 'scan.merge' in self.stages else None,
+            # Plain values only: the allowlist is recorded by its fingerprint
+            'settings': dict(detector._state_settings(), engine=detector.engine),
+        }
+    
+    def print_summary(self, detector: 'IPDetector') -> None:
+        """Print the stage table, throughput and peak memory of a finished run."""
+        summary = self.summary(detector)
+        total = summary['wall_s'] or 1e-9
+        print("\n⏱️  PROFILE:")
+        print("-" * 60)
+        print(f"   {'Stage':<20} {'Wall':>9} {'CPU':>9} {'Share':>8} {'Calls':>8}")
+        for name, stage in summary['stages'].items():
+            label = '  ' * name.count('.') + name.rsplit('.', 1)[-1]
+            cpu = f"{stage['cpu_s']:.3f}s" if 'cpu_s' in stage else ""
+            print(f"   {label:<20} {stage['wall_s']:>8.3f}s {cpu:>9} {stage['wall_s'] / total:>8.1%} "
+                  f"{stage['calls']:>8,}")
+        print(f"   {'total':<20} {total:>8.3f}s")
+        print("-" * 60)
+        if summary['bytes_per_s'] is not None:
+            print(f"   Throughput: {summary['lines_per_s']:,.0f} lines/s | {summary['hits_per_s']:,.0f} hits/s | "
+                  f"{summary['bytes_per_s'] / 1024 ** 2:,.1f} MB/s")
+        scan = summary['stages'].get('scan')
+        if scan and scan['wall_s'] > 0 and 'cpu_s' in scan:
+            busy = scan['cpu_s'] / scan['wall_s']
+            if busy > 1.05:
+                hint = "spread over worker processes"
+            elif busy >= 0.7:
+                hint = "CPU-bound: regex matching and counting dominate"
+            else:
+                hint = "mostly waiting on I/O"
+            print(f"   Scan CPU/wall: {busy:.0%} ({hint})")
+        if summary['peak_rss_bytes'] is not None:
+            workers = summary['worker_peak_rss_bytes']
+            print(f"   Peak memory: {summary['peak_rss_bytes'] / 1024 ** 2:,.1f} MB"
+                  + (f" (largest worker: {workers / 1024 ** 2:,.1f} MB)" if workers else ""))
 
 
 class IPDetector:
@@ -36,13 +796,192 @@ class IPDetector:
         'generic': IP_PATTERN
     }
     
-    def __init__(self, log_format: str = 'generic'):
-        """Initialize the IP detector with specified log format."""
+    # IP_PATTERN for raw bytes. In bytes patterns \b and \w only know ASCII,
+    # while the str patterns treat letters such as 'é' as word characters, so
+    # the boundaries count every non-ASCII byte as part of a word instead:
+    # an IP glued to a letter is skipped by every engine alike.
+    IP_BYTES_PATTERN = re.compile(rb'(?<![\w\x80-\xff])(?:[0-9]{1,3}\.){3}[0-9]{1,3}(?![\w\x80-\xff])')
+    
+    # The same patterns compiled for the mmap engine, which scans raw bytes.
+    # Leading whitespace is skipped explicitly since lines are not stripped.
+    BYTES_FORMATS = {
+        'apache': re.compile(rb'^[ \t\r\f\v\x1c-\x1f]*(\d+\.\d+\.\d+\.\d+)', re.MULTILINE),
+        'nginx': re.compile(rb'^[ \t\r\f\v\x1c-\x1f]*(\d+\.\d+\.\d+\.\d+)', re.MULTILINE),
+        'generic': IP_BYTES_PATTERN
+    }
+    
+    # IPv6 candidate: hex digits and at least two colons, optionally ending
+    # in a dotted quad, not glued to other words. Candidates such as
+    # timestamps (10:00:01) are weeded out by validation.
+    IPV6_PATTERN = re.compile(r'(?<![\w:.])(?=[0-9A-Fa-f]*:[0-9A-Fa-f]*:)[0-9A-Fa-f:]+'
+                              r'(?:\d{1,3}(?:\.\d{1,3}){3})?(?![\w:.])')
+    
+    # Patterns used with ipv6=True: the ones above, also accepting IPv6
+    LOG_FORMATS_V6 = {
+        'apache': re.compile(r'^(\d+\.\d+\.\d+\.\d+|' + IPV6_PATTERN.pattern + ')'),
+        'nginx': re.compile(r'^(\d+\.\d+\.\d+\.\d+|' + IPV6_PATTERN.pattern + ')'),
+        'generic': re.compile(IP_PATTERN.pattern + '|' + IPV6_PATTERN.pattern)
+    }
+    # IPV6_PATTERN for raw bytes, with the same non-ASCII boundaries
+    IPV6_BYTES_PATTERN = re.compile(IPV6_PATTERN.pattern.encode('ascii').replace(rb'[\w:.]', rb'[\w:.\x80-\xff]'))
+    BYTES_FORMATS_V6 = {
+        'apache': re.compile(rb'^[ \t\r\f\v\x1c-\x1f]*(\d+\.\d+\.\d+\.\d+|'
+                             + IPV6_BYTES_PATTERN.pattern + rb')', re.MULTILINE),
+        'nginx': re.compile(rb'^[ \t\r\f\v\x1c-\x1f]*(\d+\.\d+\.\d+\.\d+|'
+                            + IPV6_BYTES_PATTERN.pattern + rb')', re.MULTILINE),
+        'generic': re.compile(IP_BYTES_PATTERN.pattern + rb'|' + IPV6_BYTES_PATTERN.pattern)
+    }
+    
+    # The rest of a combined-log line after the leading IP; appended to the
+    # apache/nginx pattern when ``fields`` is set. Lines where it does not
+    # match still have their IP counted, just without field aggregates.
+    COMBINED_FIELDS = (r'(?:\S*\s+\S+\s+\S+\s+\[([^\]]+)\]\s+"(\S+)\s+(\S+)[^"]*"'
+                       r'\s+(\d{3})\s+(\d+|-))?')
+    
+    def __init__(self, log_format: str = 'generic', engine: str = 'python', track_lines: bool = True,
+                 storage: str = 'dict', approximate: bool = False, sketch_size: int = 10000,
+                 ipv6: bool = False, allowlist: RangeIndex = None, fields: bool = False):
+        """Initialize the IP detector with specified log format.
+        
+        ``engine`` selects how files are scanned: 'python' reads decoded
+        lines, 'mmap' runs a bytes pattern over a memory-mapped file and
+        'numpy' does the same but counts hits in NumPy arrays. When
+        ``track_lines`` is False the line numbers in ``ip_lines`` are not
+        recorded, which saves memory and (for the mmap engine) most of the
+        per-hit work.
+        
+        ``storage`` selects the counter backend: 'dict' keys counters by IP
+        string and keeps line numbers in lists; 'compact' keys them by packed
+        uint32 and keeps line numbers in ``array('I')``, using a fraction of
+        the memory. Compact storage normalizes zero-padded octets, so
+        ``010.0.0.1`` is counted as ``10.0.0.1``.
+        
+        With ``approximate`` the detector keeps fixed-size sketches instead
+        of exact counters: a Space-Saving summary of ``sketch_size`` heavy
+        hitters and a HyperLogLog estimate of the number of unique IPs.
+        Memory stays constant however large the input is; line numbers are
+        not available in this mode.
+        
+        With ``ipv6`` IPv6 addresses are matched as well and counted in their
+        compressed form (IPv4-mapped ones as the plain IPv4 address).
+        
+        Addresses in the ``allowlist`` RangeIndex are ignored while scanning.
+        Each distinct candidate is checked once, so even huge allowlists
+        cost almost nothing per hit. ``denylists`` maps a tag to a
+        RangeIndex; matching IPs are still counted, and are tagged in the
+        reports.
+        
+        With ``fields`` (apache/nginx formats only) the timestamp, method,
+        path, status and size of combined-log lines are parsed in the same
+        pass and aggregated per IP in ``field_aggregates``.
+        """
+        if fields and log_format not in ('apache', 'nginx'):
+            raise ValueError("field aggregation needs the apache or nginx (combined) log format")
+        if fields and approximate:
+            raise ValueError("field aggregation keeps per-IP rows and cannot be used in approximate mode")
+        if approximate and track_lines:
+            raise ValueError("approximate mode does not keep line numbers; pass track_lines=False")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}' (choose from {', '.join(ENGINES)})")
+        if engine == 'numpy' and np is None:
+            raise ValueError("the numpy engine needs NumPy (pip install numpy)")
+        if engine == 'numpy' and approximate:
+            raise ValueError("the numpy engine counts exactly; use the mmap engine with approximate mode")
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown storage '{storage}' (choose from {', '.join(STORAGES)})")
         self.format = log_format
-        self.pattern = self.LOG_FORMATS.get(log_format, self.IP_PATTERN)
-        self.ip_counts = Counter()
-        self.ip_lines = defaultdict(list)
+        self.engine = engine
+        self.track_lines = track_lines
+        self.storage = storage
+        self.ipv6 = ipv6
+        self.allowlist = allowlist
+        # Allowlist fingerprint of a detector rebuilt from state files, which
+        # has no RangeIndex of its own
+        self._allowlist_fingerprint = None
+        self.denylists = {}
+        # LogIndex objects that ``sample_lines`` reads raw log lines from
+        self.line_indexes = []
+        # PipelineProfiler set by ``attach_profiler``; None keeps the scan loops untimed
+        self.profiler = None
+        # Trailing partial line of the last ``feed_bytes`` chunk
+        self._pending = b''
+        patterns = self.LOG_FORMATS_V6 if ipv6 else self.LOG_FORMATS
+        bytes_patterns = self.BYTES_FORMATS_V6 if ipv6 else self.BYTES_FORMATS
+        self.pattern = patterns.get(log_format, patterns['generic'])
+        self.bytes_pattern = bytes_patterns.get(log_format, bytes_patterns['generic'])
+        self.fields = fields
+        if fields:
+            self.pattern = re.compile(self.pattern.pattern + self.COMBINED_FIELDS)
+            self.bytes_pattern = re.compile(self.bytes_pattern.pattern + self.COMBINED_FIELDS.encode('ascii'),
+                                            re.MULTILINE)
+            self.field_aggregates = FieldAggregates()
+        # Raw counter stores, keyed by IP string or by packed integer
+        self._counts = Counter()
+        if storage == 'compact':
+            self._lines = defaultdict(partial(array, 'I'))
+        else:
+            self._lines = defaultdict(list)
         self.total_lines = 0
+        # (path, number of its first line) for every file processed, in order
+        self.sources = []
+        self.approximate = approximate
+        self.sketch_size = sketch_size
+        if approximate:
+            self._heavy = SpaceSaving(sketch_size)
+            self._cardinality = HyperLogLog()
+        self._candidates = _CandidateCache(self._resolve_candidate,
+                                           limit=APPROX_FLUSH_KEYS if approximate else None)
+    
+    def attach_profiler(self, profiler: PipelineProfiler) -> None:
+        """Report stage timings and scan progress to ``profiler``.
+        
+        Candidate validation is timed as its own stage; scans in worker
+        processes report progress per finished chunk.
+        """
+        self.profiler = profiler
+        self._candidates.resolve = profiler.timed('validate', self._resolve_candidate)
+    
+    def _stage(self, name: str):
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+    
+    @property
+    def ip_counts(self) -> Mapping:
+        """Occurrences per IP address (only the tracked heavy hitters if approximate)."""
+        counts = self._heavy.counts if self.approximate else self._counts
+        if self.storage == 'compact':
+            return PackedIPView(counts)
+        return counts
+    
+    @property
+    def ip_lines(self) -> Mapping:
+        """Line numbers per IP address (empty unless track_lines is set)."""
+        if self.storage == 'compact':
+            return PackedIPView(self._lines)
+        return self._lines
+    
+    def _settings(self) -> dict:
+        """Constructor arguments for an empty detector configured like this one."""
+        return {'log_format': self.format, 'engine': self.engine, 'track_lines': self.track_lines,
+                'storage': self.storage, 'approximate': self.approximate,
+                'sketch_size': self.sketch_size, 'ipv6': self.ipv6, 'allowlist': self.allowlist,
+                'fields': self.fields}
+    
+    def _state_settings(self) -> dict:
+        """The settings recorded in ``to_state``, in JSON-serializable form."""
+        settings = self._settings()
+        del settings['engine']
+        if self.allowlist is not None:
+            settings['allowlist'] = self.allowlist.fingerprint()
+        else:
+            settings['allowlist'] = self._allowlist_fingerprint
+        return settings
+    
+    def _flush_sketches(self) -> None:
+        """Fold the staged exact counts into the sketches and clear them."""
+        self._heavy.update(self._counts)
+        for key in self._counts:
+            self._cardinality.add(key)
+        self._counts.clear()
         
     def extract_ips_from_line(self, line: str, line_num: int) -> List[str]:
         """Extract IP addresses from a single line."""
@@ -64,31 +1003,729 @@ class IPDetector:
         except ValueError:
             return False
     
-    def process_log_file(self, filepath: str, encoding: str = 'utf-8') -> None:
-        """Process the log file and extract IP addresses."""
-        try:
+    def _resolve_candidate(self, candidate):
+        """Turn a raw pattern match (str or bytes) into a counter key, or None if invalid."""
+        ip = candidate.decode('ascii') if isinstance(candidate, bytes) else candidate
+        if ':' in ip:
+            ip = canonical_ipv6(ip)
+            if ip is None:
+                return None
+        elif not self.is_valid_ip(ip):
+            return None
+        if self.storage != 'compact' and self.allowlist is None:
+            return ip
+        key = pack_ip(ip)
+        if self.allowlist is not None and key in self.allowlist:
+            return None
+        return key if self.storage == 'compact' else ip
+    
+    def process_log_file(self, filepath: str, encoding: str = 'utf-8', workers: int = 1,
+                         start: int = 0, end: int = None) -> None:
+        """Process the log file and extract IP addresses.
+        
+        Errors are printed and end the program, as the command line tool
+        expects; ``scan_file`` does the same work but raises instead.
+        """
+        with _exit_on_error(filepath):
+            self.scan_file(filepath, encoding, workers, start, end)
+    
+    def scan_file(self, filepath: str, encoding: str = 'utf-8', workers: int = 1,
+                  start: int = 0, end: int = None) -> None:
+        """Count the IPs in a log file, raising OSError/ValueError on failure.
+
+        With ``workers`` > 1 the file is split at newline-aligned byte offsets
+        and the chunks are parsed by a process pool (see ``_process_parallel``).
+        The resulting counts and line numbers are identical to a single pass.
+        
+        ``start`` and ``end`` limit processing to a byte range that begins
+        and ends on line boundaries. Its lines are numbered after the lines
+        this detector has already counted, so a log can be processed in
+        consecutive pieces.
+        """
+        if self.engine != 'python':
+            check_ascii_compatible(encoding)
+        if end is None:
+            end = os.path.getsize(filepath)
+        self._add_source(filepath, self.total_lines + 1)
+        if workers > 1:
+            self._process_parallel(filepath, encoding, workers, start, end)
+        elif start > 0 or end < os.path.getsize(filepath):
+            self._scan_file_range(filepath, start, end, encoding)
+        else:
+            self._scan_file(filepath, encoding)
+    
+    def process_log_files(self, filepaths: List[str], encoding: str = 'utf-8', workers: int = 1) -> None:
+        """Process several logs, plain or compressed, as one combined log.
+        
+        Errors are printed and end the program; ``scan_files`` raises instead.
+        """
+        with _exit_on_error(', '.join(filepaths)):
+            self.scan_files(filepaths, encoding, workers)
+    
+    def scan_files(self, filepaths: List[str], encoding: str = 'utf-8', workers: int = 1) -> None:
+        """Count the IPs in several logs, plain or compressed, as one combined log.
+        
+        Lines are numbered across all files in the given order, and
+        ``sources`` records where each file starts so ``format_line`` can
+        map a line number back to its file. With ``workers`` > 1 the files
+        are spread over a process pool (a single plain file is split into
+        chunks instead).
+        """
+        if len(filepaths) == 1 and not is_compressed(filepaths[0]):
+            self.scan_file(filepaths[0], encoding, workers)
+            return
+        
+        if self.engine != 'python':
+            check_ascii_compatible(encoding)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                partials = pool.map(_parse_file, [self._settings()] * len(filepaths),
+                                    filepaths, [encoding] * len(filepaths))
+                for filepath, part in zip(filepaths, partials):
+                    with self._stage('merge'):
+                        self.merge(part, line_offset=self.total_lines)
+                    if self.profiler:
+                        self.profiler.advance(os.path.getsize(filepath))
+        else:
+            for filepath in filepaths:
+                self._add_source(filepath, self.total_lines + 1)
+                self._scan_file(filepath, encoding)
+    
+    def feed_lines(self, lines: Iterable[str]) -> List[Tuple[str, int]]:
+        """Count a batch of text lines; return its hits as (ip, line number) pairs.
+        
+        Lines are numbered after the lines already counted and may keep
+        their line endings. Like every ``feed_*``/``scan_*`` method this
+        raises on bad input instead of exiting.
+        """
+        lookup = self._candidates.__getitem__
+        hits = []
+        for line_num, line in enumerate(lines, self.total_lines + 1):
+            self.total_lines += 1
+            line = line.strip()
+            if not line:
+                continue
+            if self.fields:
+                match = self.pattern.match(line)
+                candidates = (match.group(1),) if match else ()
+            else:
+                match = None
+                candidates = self.extract_ips_from_line(line, line_num)
+            for candidate in candidates:
+                key = lookup(candidate)
+                if key is None:
+                    continue
+                self._count_hit(key, line_num)
+                if match and match.group(2) is not None:
+                    self.field_aggregates.add(key, *match.group(2, 3, 4, 5, 6))
+                hits.append((self.key_to_ip(key), line_num))
+        if self.approximate:
+            self._flush_sketches()
+        return hits
+    
+    def feed_bytes(self, chunk: bytes) -> List[Tuple[str, int]]:
+        """Count the complete lines in a chunk of raw log bytes; return their hits.
+        
+        Chunks may split lines anywhere: the part after the last newline is
+        kept and counted with the next chunk, or by ``flush`` at the end of
+        the stream. The bytes are matched without decoding, so the log must
+        use an ASCII-compatible encoding.
+        """
+        data = self._pending + bytes(chunk) if self._pending else bytes(chunk)
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        hits = []
+        pos = 0
+        while pos < end:
+            # Large chunks are counted in blocks so the sketches and hit lists stay bounded
+            block_end = data.find(b'\n', min(pos + STREAM_BATCH_BYTES, end) - 1, end) + 1 or end
+            hits.extend(self._feed_buffer(data, pos, block_end))
+            pos = block_end
+        return hits
+    
+    def flush(self) -> List[Tuple[str, int]]:
+        """Count a last line that ``feed_bytes`` kept because it had no newline yet."""
+        if not self._pending:
+            return []
+        data, self._pending = self._pending + b'\n', b''
+        return self._feed_buffer(data, 0, len(data))
+    
+    def _feed_buffer(self, buf: bytes, start: int, end: int) -> List[Tuple[str, int]]:
+        """Count the whole lines in buf[start:end] and return their hits."""
+        pattern = self.bytes_pattern
+        group = 1 if pattern.groups else 0
+        lookup = self._candidates.__getitem__
+        hits = []
+        line_num = self.total_lines + 1
+        last = start
+        for match in pattern.finditer(buf, start, end):
+            key = lookup(match.group(group))
+            if key is None:
+                continue
+            hit = match.start()
+            line_num += buf.count(b'\n', last, hit)
+            last = hit
+            self._count_hit(key, line_num)
+            if self.fields and match.group(2) is not None:
+                self.field_aggregates.add(key, *(field.decode('latin-1') for field in match.group(2, 3, 4, 5, 6)))
+            hits.append((self.key_to_ip(key), line_num))
+        self.total_lines = line_num - 1 + buf.count(b'\n', last, end)
+        if self.approximate:
+            self._flush_sketches()
+        return hits
+    
+    def _count_hit(self, key, line_num: int) -> None:
+        self._counts[key] += 1
+        if self.track_lines:
+            self._lines[key].append(line_num)
+    
+    def _feed_batch(self, batch: list) -> List[Tuple[str, int]]:
+        """Feed a batch of stream items in order: runs of text lines, byte chunks."""
+        hits = []
+        lines = []
+        for item in batch:
+            if isinstance(item, str):
+                if self._pending:
+                    # A text line ends a partial byte line left by an earlier chunk
+                    hits.extend(self.flush())
+                lines.append(item)
+            else:
+                if lines:
+                    hits.extend(self.feed_lines(lines))
+                    lines = []
+                hits.extend(self.feed_bytes(item))
+        if lines:
+            hits.extend(self.feed_lines(lines))
+        return hits
+    
+    def scan_stream(self, source: Iterable[Union[str, bytes]], batch_items: int = STREAM_BATCH_ITEMS,
+                    batch_bytes: int = STREAM_BATCH_BYTES, name: str = '<stream>') -> Iterator[Tuple[str, int]]:
+        """Count the IPs in an iterable of text lines and/or byte chunks, yielding each hit.
+        
+        Hits are (ip, line number) pairs in log order. The source is read
+        lazily in batches of at most ``batch_items`` items or ``batch_bytes``
+        bytes, so at most one batch of input and hits is held at a time and
+        a slow consumer holds back the source. Counts, ``snapshot`` and the
+        reports can be used between hits and after the stream ends; a line
+        left without a final newline is counted when the source is
+        exhausted.
+        """
+        self._add_source(name, self.total_lines + 1)
+        batch, size = [], 0
+        for item in source:
+            batch.append(item)
+            size += _stream_item_size(item)
+            if len(batch) >= batch_items or size >= batch_bytes:
+                yield from self._feed_batch(batch)
+                batch, size = [], 0
+        yield from self._feed_batch(batch)
+        yield from self.flush()
+    
+    async def ascan_stream(self, source: Union[AsyncIterable[Union[str, bytes]], Iterable[Union[str, bytes]]],
+                           batch_items: int = STREAM_BATCH_ITEMS, batch_bytes: int = STREAM_BATCH_BYTES,
+                           name: str = '<stream>') -> AsyncIterator[Tuple[str, int]]:
+        """``scan_stream`` for asyncio: accepts an async (or plain) iterable and yields hits.
+        
+        Each batch is counted synchronously and the event loop gets control
+        back between batches, so other tasks (such as one taking snapshots)
+        keep running while a long stream is consumed.
+        """
+        if not hasattr(source, '__aiter__'):
+            for hit in self.scan_stream(source, batch_items, batch_bytes, name):
+                yield hit
+            return
+        self._add_source(name, self.total_lines + 1)
+        batch, size = [], 0
+        async for item in source:
+            batch.append(item)
+            size += _stream_item_size(item)
+            if len(batch) >= batch_items or size >= batch_bytes:
+                for hit in self._feed_batch(batch):
+                    yield hit
+                batch, size = [], 0
+                await asyncio.sleep(0)
+        for hit in self._feed_batch(batch) + self.flush():
+            yield hit
+    
+    def snapshot(self, min_count: int = 1, top_n: int = None) -> dict:
+        """Current statistics plus the ``top_n`` IPs seen at least ``min_count`` times.
+        
+        Safe to call between hits of ``scan_stream``/``ascan_stream``; the
+        returned data is a copy that later input does not change.
+        """
+        stats = self.get_statistics()
+        stats['top'] = self.sorted_duplicates(min_count, top_n)
+        return stats
+    
+    def _scan_file(self, filepath: str, encoding: str) -> None:
+        """Scan a whole file; compressed files are decompressed as a stream."""
+        opener = COMPRESSED_OPENERS.get(os.path.splitext(filepath)[1].lower())
+        if opener:
+            with open(filepath, 'rb') as raw, opener(raw, 'rt', encoding=encoding) as file:
+                self._scan_lines(self._with_progress(file, raw), self.total_lines + 1)
+        elif self.engine != 'python':
+            self._scan_file_range(filepath, 0, os.path.getsize(filepath), encoding)
+        else:
             with open(filepath, 'r', encoding=encoding) as file:
-                for line_num, line in enumerate(file, 1):
-                    self.total_lines += 1
-                    line = line.strip()
-                    if not line:
+                self._scan_lines(self._with_progress(file, file.buffer), self.total_lines + 1)
+    
+    def _with_progress(self, file, raw) -> Iterable[str]:
+        """The lines of ``file``, reporting the bytes read from ``raw`` to the profiler.
+        
+        Without a profiler the file itself is returned, so the scan loop
+        pays nothing for progress tracking.
+        """
+        if self.profiler is None:
+            return file
+        return self._read_with_progress(file, raw)
+    
+    def _read_with_progress(self, file, raw) -> Iterable[str]:
+        advance = self.profiler.advance
+        position = raw.tell()
+        while True:
+            lines = file.readlines(PROGRESS_READ_CHARS)
+            if not lines:
+                break
+            yield from lines
+            now = raw.tell()
+            advance(now - position)
+            position = now
+    
+    def _add_source(self, filepath: str, first_line: int) -> None:
+        if not self.sources or self.sources[-1][0] != filepath:
+            self.sources.append((filepath, first_line))
+    
+    def format_line(self, line_num: int) -> str:
+        """Show a line number, prefixed with its file when several logs were read."""
+        if len(self.sources) <= 1:
+            return str(line_num)
+        index = bisect_right([first for _, first in self.sources], line_num) - 1
+        filepath, first_line = self.sources[max(index, 0)]
+        return f"{filepath}:{line_num - first_line + 1}"
+    
+    def _scan_lines(self, lines: Iterable[str], first_line: int = 1) -> None:
+        """Count the IPs found in an iterable of lines numbered from first_line."""
+        if self.fields:
+            self._scan_field_lines(lines, first_line)
+            return
+        lookup = self._candidates.__getitem__
+        for line_num, line in enumerate(lines, first_line):
+            self.total_lines += 1
+            line = line.strip()
+            if not line:
+                continue
+                
+            ips = self.extract_ips_from_line(line, line_num)
+            for ip in ips:
+                key = lookup(ip)
+                if key is not None:
+                    self._counts[key] += 1
+                    if self.track_lines:
+                        self._lines[key].append(line_num)
+            
+            if self.approximate and len(self._counts) >= APPROX_FLUSH_KEYS:
+                self._flush_sketches()
+        
+        if self.approximate:
+            self._flush_sketches()
+    
+    def _scan_field_lines(self, lines: Iterable[str], first_line: int) -> None:
+        """``_scan_lines`` for field aggregation: one match per line yields the IP and its fields."""
+        pattern = self.pattern
+        lookup = self._candidates.__getitem__
+        add_fields = self.field_aggregates.add
+        for line_num, line in enumerate(lines, first_line):
+            self.total_lines += 1
+            match = pattern.match(line.strip())
+            if not match:
+                continue
+            key = lookup(match.group(1))
+            if key is None:
+                continue
+            self._counts[key] += 1
+            if self.track_lines:
+                self._lines[key].append(line_num)
+            if match.group(2) is not None:
+                add_fields(key, *match.group(2, 3, 4, 5, 6))
+    
+    def _scan_buffer_fields(self, buf, start: int, end: int) -> None:
+        """``_scan_buffer`` for field aggregation, decoding only the fields of matched lines."""
+        lookup = self._candidates.__getitem__
+        add_fields = self.field_aggregates.add
+        progress = self.profiler.advance if self.profiler else None
+        line_num = self.total_lines + 1
+        
+        pos = start
+        while pos < end:
+            block_end = buf.find(b'\n', min(pos + SCAN_BLOCK_BYTES, end) - 1, end) + 1 or end
+            last = pos
+            for match in self.bytes_pattern.finditer(buf, pos, block_end):
+                key = lookup(match.group(1))
+                if key is None:
+                    continue
+                hit = match.start()
+                line_num += buf[last:hit].count(b'\n')
+                last = hit
+                self._counts[key] += 1
+                if self.track_lines:
+                    self._lines[key].append(line_num)
+                if match.group(2) is not None:
+                    add_fields(key, *(field.decode('latin-1') for field in match.group(2, 3, 4, 5, 6)))
+            line_num += buf[last:block_end].count(b'\n')
+            if progress:
+                progress(block_end - pos)
+            pos = block_end
+        
+        if buf[end - 1:end] != b'\n':
+            line_num += 1
+        self.total_lines = line_num - 1
+    
+    def _scan_file_range(self, filepath: str, start: int, end: int, encoding: str) -> None:
+        """Scan the whole lines in bytes start:end of a file with the configured engine."""
+        if self.engine != 'python':
+            if end > start:
+                with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    if _BARE_CR.search(buf, start, end):
+                        raise ValueError(f"the {self.engine} engine only splits lines at '\\n', and "
+                                         f"'{filepath}' has bare '\\r' line endings; use --engine python")
+                    if self.fields:
+                        self._scan_buffer_fields(buf, start, end)
+                    elif self.engine == 'numpy':
+                        self._scan_buffer_numpy(buf, start, end)
+                    else:
+                        self._scan_buffer(buf, start, end)
+            return
+        
+        with open(filepath, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        self._scan_lines(io.StringIO(data.decode(encoding), newline=None), self.total_lines + 1)
+        if self.profiler:
+            self.profiler.advance(end - start)
+    
+    def _scan_buffer(self, buf, start: int, end: int) -> None:
+        """Run the bytes pattern over buf[start:end] without decoding any lines.
+        
+        Each distinct candidate is validated once through ``_candidates``.
+        Without line tracking, a whole block is matched with ``findall`` and
+        counted by ``Counter.update`` so the per-hit work stays in C; with
+        line tracking, ``finditer`` is used and line numbers are derived by
+        counting the newlines between consecutive hits.
+        """
+        pattern = self.bytes_pattern
+        group = 1 if pattern.groups else 0
+        lookup = self._candidates.__getitem__
+        counts = self._counts
+        lines = self._lines
+        progress = self.profiler.advance if self.profiler else None
+        line_num = self.total_lines + 1
+        
+        pos = start
+        while pos < end:
+            block_end = buf.find(b'\n', min(pos + SCAN_BLOCK_BYTES, end) - 1, end) + 1 or end
+            
+            if not self.track_lines:
+                counts.update(map(lookup, pattern.findall(buf, pos, block_end)))
+                line_num += buf[pos:block_end].count(b'\n')
+            else:
+                last = pos
+                for match in pattern.finditer(buf, pos, block_end):
+                    key = lookup(match.group(group))
+                    if key is None:
                         continue
-                        
-                    ips = self.extract_ips_from_line(line, line_num)
-                    for ip in ips:
-                        if self.is_valid_ip(ip):
-                            self.ip_counts[ip] += 1
-                            self.ip_lines[ip].append(line_num)
-                            
-        except FileNotFoundError:
-            print(f"Error: File '{filepath}' not found.")
-            sys.exit(1)
-        except UnicodeDecodeError:
-            print(f"Error: Could not decode file '{filepath}'. Try different encoding.")
-            sys.exit(1)
-        except Exception as e:
-            print(f"Error processing file: {e}")
-            sys.exit(1)
+                    hit = match.start()
+                    line_num += buf[last:hit].count(b'\n')
+                    last = hit
+                    counts[key] += 1
+                    lines[key].append(line_num)
+                line_num += buf[last:block_end].count(b'\n')
+            if progress:
+                progress(block_end - pos)
+            pos = block_end
+            
+            if self.approximate and len(counts) >= APPROX_FLUSH_KEYS:
+                counts.pop(None, None)
+                self._flush_sketches()
+        
+        # Invalid candidates are counted under None by the fast path
+        counts.pop(None, None)
+        if self.approximate:
+            self._flush_sketches()
+        if buf[end - 1:end] != b'\n':
+            line_num += 1
+        self.total_lines = line_num - 1
+    
+    def _scan_buffer_numpy(self, buf, start: int, end: int) -> None:
+        """Count the hits in buf[start:end] with NumPy instead of a Counter.
+        
+        Every distinct IP gets a dense id in first-seen order (id 0 collects
+        invalid candidates). Each block's matches become a ``uint32`` id
+        array which ``np.bincount`` counts in one call. With line tracking,
+        line numbers come from ``searchsorted`` over the block's newline
+        offsets, and are grouped per IP by a stable argsort of the ids.
+        Because ids follow first appearance, ``ip_counts`` ends up in the
+        same order as with the other engines.
+        """
+        pattern = self.bytes_pattern
+        group = 1 if pattern.groups else 0
+        keys = [None]
+        key_ids = {}
+        
+        def resolve(candidate):
+            key = self._candidates[candidate]
+            if key is None:
+                return 0
+            if key not in key_ids:
+                key_ids[key] = len(keys)
+                keys.append(key)
+            return key_ids[key]
+        
+        lookup = _CandidateCache(resolve).__getitem__
+        totals = np.zeros(1, dtype=np.int64)
+        id_blocks, line_blocks = [], []
+        lines_before = self.total_lines
+        progress = self.profiler.advance if self.profiler else None
+        
+        pos = start
+        while pos < end:
+            block_end = buf.find(b'\n', min(pos + SCAN_BLOCK_BYTES, end) - 1, end) + 1 or end
+            
+            if not self.track_lines:
+                found = pattern.findall(buf, pos, block_end)
+                ids = np.fromiter(map(lookup, found), dtype=np.uint32, count=len(found))
+                lines_before += buf[pos:block_end].count(b'\n')
+            else:
+                matches = [(lookup(match.group(group)), match.start() - pos)
+                           for match in pattern.finditer(buf, pos, block_end)]
+                hits = np.fromiter(chain.from_iterable(matches), dtype=np.int64,
+                                   count=2 * len(matches)).reshape(-1, 2)
+                ids = hits[:, 0].astype(np.uint32)
+                block = np.frombuffer(buf, dtype=np.uint8, count=block_end - pos, offset=pos)
+                newlines = np.flatnonzero(block == ord('\n'))
+                del block
+                valid = ids != 0
+                id_blocks.append(ids[valid])
+                line_blocks.append(lines_before + 1 + np.searchsorted(newlines, hits[valid, 1], side='right'))
+                lines_before += len(newlines)
+            
+            block_counts = np.bincount(ids, minlength=len(keys))
+            if len(block_counts) > len(totals):
+                totals = np.concatenate([totals, np.zeros(len(block_counts) - len(totals), dtype=np.int64)])
+            totals[:len(block_counts)] += block_counts
+            if progress:
+                progress(block_end - pos)
+            pos = block_end
+        
+        if buf[end - 1:end] != b'\n':
+            lines_before += 1
+        self.total_lines = lines_before
+        self._counts.update(dict(zip(keys[1:], totals[1:].tolist())))
+        
+        if self.track_lines and id_blocks:
+            ids = np.concatenate(id_blocks)
+            line_nums = np.concatenate(line_blocks)[np.argsort(ids, kind='stable')]
+            bounds = np.cumsum(totals[1:])[:-1]
+            for key, key_lines in zip(keys[1:], np.split(line_nums, bounds)):
+                self._lines[key].extend(key_lines.tolist())
+    
+    def line_offsets(self, filepath: str) -> Dict[int, array]:
+        """Byte offsets of the lines each IP appears on, keyed by pack_ip key.
+        
+        Makes its own memory-mapped pass over the file with this detector's
+        bytes pattern and allowlist. An IP that appears several times on a
+        line gets that line's offset only once.
+        """
+        offsets = defaultdict(partial(array, 'Q'))
+        pattern = self.bytes_pattern
+        group = 1 if pattern.groups else 0
+        lookup = self._candidates.__getitem__
+        compact = self.storage == 'compact'
+        if os.path.getsize(filepath) == 0:
+            return offsets
+        
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for match in pattern.finditer(buf):
+                key = lookup(match.group(group))
+                if key is None:
+                    continue
+                postings = offsets[key if compact else pack_ip(key)]
+                line_start = buf.rfind(b'\n', 0, match.start()) + 1
+                if not postings or postings[-1] != line_start:
+                    postings.append(line_start)
+        return offsets
+    
+    def sample_lines(self, ip: str, limit: int) -> List[str]:
+        """Up to ``limit`` raw log lines containing ``ip``, read through ``line_indexes``."""
+        lines = []
+        for index in self.line_indexes:
+            lines.extend(index.lines(ip, limit - len(lines)))
+            if len(lines) >= limit:
+                break
+        return lines
+    
+    def _process_parallel(self, filepath: str, encoding: str, workers: int, start: int, end: int) -> None:
+        """Parse newline-aligned chunks in a process pool and merge them in order.
+        
+        Chunks are merged in file order, so IPs keep their first-seen order
+        (which breaks ties in the report) and every chunk's line numbers are
+        shifted by the number of lines in the chunks before it.
+        """
+        chunk_count = max(workers, -(-(end - start) // CHUNK_BYTES))
+        offsets = chunk_offsets(filepath, chunk_count, start, end)
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = pool.map(
+                _parse_chunk,
+                [self._settings()] * (len(offsets) - 1),
+                [filepath] * (len(offsets) - 1),
+                offsets[:-1],
+                offsets[1:],
+                [encoding] * (len(offsets) - 1),
+            )
+            for chunk_start, chunk_end, part in zip(offsets, offsets[1:], partials):
+                with self._stage('merge'):
+                    self.merge(part, line_offset=self.total_lines)
+                if self.profiler:
+                    self.profiler.advance(chunk_end - chunk_start)
+    
+    def merge(self, other: 'IPDetector', line_offset: int = 0) -> None:
+        """Merge another detector's results into this one.
+        
+        Line numbers from ``other`` are shifted by ``line_offset``, which lets
+        results for consecutive pieces of one log be combined exactly.
+        """
+        if other.storage != self.storage:
+            raise ValueError("cannot merge detectors that use different storage backends")
+        if other.approximate and not self.approximate:
+            raise ValueError("cannot merge approximate results into an exact detector")
+        self.total_lines += other.total_lines
+        for filepath, first_line in other.sources:
+            self._add_source(filepath, first_line + line_offset)
+        if self.approximate:
+            if other.approximate:
+                self._heavy.merge(other._heavy)
+                self._cardinality.merge(other._cardinality)
+            else:
+                self._counts.update(other._counts)
+                self._flush_sketches()
+            return
+        for key, count in other._counts.items():
+            self._counts[key] += count
+        for key, lines in other._lines.items():
+            self._lines[key].extend(line + line_offset for line in lines)
+        if self.fields and other.fields:
+            self.field_aggregates.merge(other.field_aggregates)
+    
+    def to_state(self) -> dict:
+        """JSON-serializable snapshot of the settings and everything counted so far."""
+        state = self._state_header()
+        state['counts'] = list(self._counts.items())
+        state['lines'] = [[key, list(lines)] for key, lines in self._lines.items()]
+        return state
+    
+    def _state_header(self) -> dict:
+        """The part of ``to_state`` that does not grow with the number of IPs."""
+        if self.fields:
+            raise ValueError("field aggregates are not included in saved state; use fields=False")
+        header = {
+            'settings': self._state_settings(),
+            'total_lines': self.total_lines,
+            'sources': self.sources,
+        }
+        if self.approximate:
+            header['sketches'] = {
+                'counts': [[key, count, self._heavy.errors[key]] for key, count in self._heavy.counts.items()],
+                'total': self._heavy.total,
+                'registers': self._cardinality.registers.hex(),
+            }
+        return header
+    
+    def _sketches_from_state(self, sketches: dict) -> Tuple[SpaceSaving, HyperLogLog]:
+        heavy = SpaceSaving(self.sketch_size)
+        heavy.counts = {key: count for key, count, _ in sketches['counts']}
+        heavy.errors = {key: error for key, _, error in sketches['counts']}
+        heavy.total = sketches['total']
+        cardinality = HyperLogLog()
+        cardinality.registers = bytearray.fromhex(sketches['registers'])
+        return heavy, cardinality
+    
+    def restore_state(self, state: dict) -> None:
+        """Load a snapshot made by ``to_state`` into this (empty) detector.
+        
+        Raises ValueError if the snapshot was taken with different settings.
+        """
+        # States saved by older versions lack the settings added since
+        defaults = {'ipv6': False, 'allowlist': None, 'fields': False}
+        if dict(defaults, **state['settings']) != self._state_settings():
+            raise ValueError("saved state was made with different detector settings")
+        
+        self.total_lines = state['total_lines']
+        self.sources = [tuple(source) for source in state['sources']]
+        self._counts.update(dict(state['counts']))
+        for key, lines in state['lines']:
+            self._lines[key].extend(lines)
+        if self.approximate:
+            self._heavy, self._cardinality = self._sketches_from_state(state['sketches'])
+    
+    def merge_state_records(self, header: dict, records: Iterable[Tuple[object, int, Iterable[int]]]) -> None:
+        """Merge a saved state given as its header and a stream of (key, count, lines) records.
+        
+        Works like ``merge`` with the saved lines numbered after the ones
+        counted so far, but only one record is held in memory at a time.
+        """
+        line_offset = self.total_lines
+        self.total_lines += header['total_lines']
+        for filepath, first_line in header['sources']:
+            self._add_source(filepath, first_line + line_offset)
+        if self.approximate and 'sketches' in header:
+            heavy, cardinality = self._sketches_from_state(header['sketches'])
+            self._heavy.merge(heavy)
+            self._cardinality.merge(cardinality)
+        for key, count, lines in records:
+            self._counts[key] += count
+            if lines:
+                self._lines[key].extend(map(line_offset.__add__, lines) if line_offset else lines)
+        if self.approximate:
+            self._flush_sketches()
+    
+    def key_to_ip(self, key) -> str:
+        """Display form of a raw counter key (IP string or packed integer)."""
+        return unpack_ip(key) if self.storage == 'compact' else key
+    
+    def ip_fields(self, ip: str) -> dict:
+        """Field aggregates of ``ip`` (see ``FieldAggregates.summary``), or None."""
+        if not self.fields:
+            return None
+        try:
+            key = pack_ip(ip) if self.storage == 'compact' else ip
+        except ValueError:
+            return None
+        return self.field_aggregates.summary(key)
+    
+    def ip_tags(self, ip: str) -> List[str]:
+        """Tags of the denylists that contain ``ip``."""
+        if not self.denylists:
+            return []
+        key = pack_ip(ip)
+        return [tag for tag, ranges in self.denylists.items() if key in ranges]
+    
+    def subnet_tries(self) -> Dict[int, PrefixTrie]:
+        """Radix trees of the per-IP counts, keyed by IP version (4 and 6).
+        
+        They are built from the counts gathered by the scan, so subnets of
+        any prefix length can be reported without reading the logs again.
+        In approximate mode only the tracked heavy hitters are included.
+        """
+        counts = self._heavy.counts if self.approximate else self._counts
+        packed = {4: Counter(), 6: Counter()}
+        for key, count in counts.items():
+            if self.storage != 'compact':
+                key = pack_ip(key)
+            if key < IPV6_KEY_OFFSET:
+                packed[4][key] += count
+            else:
+                packed[6][key - IPV6_KEY_OFFSET] += count
+        return {4: PrefixTrie(packed[4], 32), 6: PrefixTrie(packed[6], 128)}
     
     def get_duplicates(self, min_count: int = 2) -> Dict[str, int]:
         """Get IP addresses that appear more than min_count times."""
@@ -97,16 +1734,64 @@ class IPDetector:
     def get_statistics(self) -> Dict[str, int]:
         """Get overall statistics about the log analysis."""
         duplicates = self.get_duplicates()
-        return {
-            'total_lines': self.total_lines,
-            'unique_ips': len(self.ip_counts),
-            'total_ip_occurrences': sum(self.ip_counts.values()),
-            'duplicate_ips': len(duplicates),
-            'duplicate_occurrences': sum(duplicates.values())
-        }
+        if self.approximate:
+            # unique_ips is a HyperLogLog estimate and the duplicate figures
+            # only cover the heavy hitters tracked by the Space-Saving summary
+            stats = {
+                'total_lines': self.total_lines,
+                'unique_ips': self._cardinality.estimate(),
+                'total_ip_occurrences': self._heavy.total,
+                'duplicate_ips': len(duplicates),
+                'duplicate_occurrences': sum(duplicates.values())
+            }
+        else:
+            stats = {
+                'total_lines': self.total_lines,
+                'unique_ips': len(self.ip_counts),
+                'total_ip_occurrences': sum(self.ip_counts.values()),
+                'duplicate_ips': len(duplicates),
+                'duplicate_occurrences': sum(duplicates.values())
+            }
+        if self.denylists:
+            denylisted = [count for ip, count in self.ip_counts.items() if self.ip_tags(ip)]
+            stats['denylisted_ips'] = len(denylisted)
+            stats['denylisted_occurrences'] = sum(denylisted)
+        return stats
+    
+    def count_error(self, ip: str) -> int:
+        """How much an approximate count for ``ip`` may overestimate the true one."""
+        errors = self._heavy.errors
+        return (PackedIPView(errors) if self.storage == 'compact' else errors).get(ip, 0)
     
-    def print_report(self, min_count: int = 2, show_lines: bool = False, top_n: int = None) -> None:
-        """Print a detailed report of duplicate IP addresses."""
+    def sorted_duplicates(self, min_count: int = 2, top_n: int = None) -> List[Tuple[str, int]]:
+        """Duplicates ordered by count (descending), first-seen first on ties.
+        
+        For the numpy engine the top N are picked with ``np.argpartition``
+        instead of sorting every duplicate; ties at the cut-off are resolved
+        the same way as the full stable sort.
+        """
+        with self._stage('sort'):
+            return self._sorted_duplicates(min_count, top_n)
+    
+    def _sorted_duplicates(self, min_count: int, top_n: int) -> List[Tuple[str, int]]:
+        items = list(self.get_duplicates(min_count).items())
+        if self.engine == 'numpy' and top_n and top_n < len(items):
+            counts = np.fromiter((count for _, count in items), dtype=np.int64, count=len(items))
+            cutoff = counts[np.argpartition(-counts, top_n - 1)[:top_n]].min()
+            candidates = np.flatnonzero(counts >= cutoff)
+            order = candidates[np.argsort(-counts[candidates], kind='stable')][:top_n]
+            return [items[i] for i in order]
+        
+        items.sort(key=lambda x: x[1], reverse=True)
+        return items[:top_n] if top_n else items
+    
+    def print_report(self, min_count: int = 2, show_lines: bool = False, top_n: int = None,
+                     subnets: List[int] = (), subnets6: List[int] = ()) -> None:
+        """Print a detailed report of duplicate IP addresses.
+        
+        ``subnets`` and ``subnets6`` are IPv4 and IPv6 prefix lengths; for
+        each one the top subnets (at least ``min_count`` hits) are listed too.
+        """
         duplicates = self.get_duplicates(min_count)
         stats = self.get_statistics()
         
@@ -118,50 +1803,121 @@ class IPDetector:
         # Statistics
         print(f"\n📊 STATISTICS:")
         print(f"   Total lines processed: {stats['total_lines']:,}")
-        print(f"   Unique IP addresses: {stats['unique_ips']:,}")
+        if self.approximate:
+            error = self._cardinality.relative_error()
+            print(f"   Unique IP addresses: ~{stats['unique_ips']:,} (±{error:.1%} std. error)")
+        else:
+            print(f"   Unique IP addresses: {stats['unique_ips']:,}")
         print(f"   Total IP occurrences: {stats['total_ip_occurrences']:,}")
         print(f"   IPs appearing ≥{min_count} times: {stats['duplicate_ips']:,}")
+        if self.denylists:
+            print(f"   Denylisted IPs: {stats['denylisted_ips']:,} "
+                  f"({stats['denylisted_occurrences']:,} occurrences)")
+        if self.approximate:
+            print(f"   Approximate counts: top {self.sketch_size:,} tracked, "
+                  f"each overestimated by at most {self._heavy.max_error():,}")
         
         if not duplicates:
             print(f"\n✅ No duplicate IP addresses found (threshold: {min_count})")
-            return
-        
-        # Sort duplicates by count (descending)
-        sorted_duplicates = sorted(duplicates.items(), key=lambda x: x[1], reverse=True)
+        else:
+            self._print_duplicates(min_count, show_lines, top_n)
         
-        # Limit to top N if specified
-        if top_n:
-            sorted_duplicates = sorted_duplicates[:top_n]
+        if subnets or subnets6:
+            self._print_subnets(subnets, subnets6, min_count, top_n or 10)
+    
+    def _print_duplicates(self, min_count: int, show_lines: bool, top_n: int) -> None:
+        # Sort duplicates by count (descending), limited to top N if specified
+        sorted_duplicates = self.sorted_duplicates(min_count, top_n)
         
         print(f"\n🚨 DUPLICATE IPs (showing {'top ' + str(top_n) if top_n else 'all'}):")
         print("-" * 60)
         
+        width = 39 if self.ipv6 else 15
         for ip, count in sorted_duplicates:
-            print(f"   {ip:<15} | {count:>5} occurrences", end="")
+            print(f"   {ip:<{width}} | {count:>5} occurrences", end="")
+            tags = self.ip_tags(ip)
+            if tags:
+                print(f" | ⛔ {', '.join(tags)}", end="")
             
-            if show_lines:
+            if self.approximate:
+                print(f" (overestimate ≤ {self.count_error(ip)})")
+            elif show_lines:
                 lines = self.ip_lines[ip]
                 if len(lines) <= 5:
-                    print(f" | Lines: {', '.join(map(str, lines))}")
+                    print(f" | Lines: {', '.join(map(self.format_line, lines))}")
                 else:
-                    print(f" | Lines: {', '.join(map(str, lines[:3]))}...+{len(lines)-3} more")
+                    print(f" | Lines: {', '.join(map(self.format_line, lines[:3]))}...+{len(lines)-3} more")
             else:
                 print()
+            
+            fields = self.ip_fields(ip)
+            if fields:
+                print(f"      ↳ {format_fields(fields)}")
         
         print("-" * 60)
     
-    def save_report(self, output_file: str, min_count: int = 2) -> None:
-        """Save duplicate IPs to a file."""
-        duplicates = self.get_duplicates(min_count)
+    def _print_subnets(self, subnets: List[int], subnets6: List[int], min_count: int, top_n: int) -> None:
+        tries = self.subnet_tries()
+        note = " (tracked heavy hitters only)" if self.approximate else ""
+        for version, lengths in ((4, subnets), (6, subnets6)):
+            trie = tries[version]
+            for length in lengths:
+                print(f"\n🌐 TOP IPv{version} /{length} SUBNETS (showing top {top_n}){note}:")
+                print("-" * 60)
+                top = trie.top(length, top_n, min_count)
+                for prefix, total, addresses in top:
+                    print(f"   {trie.network(prefix, length):<18} | {total:>5} occurrences | "
+                          f"{addresses:,} IP{'s' if addresses != 1 else ''}")
+                if not top:
+                    print(f"   No subnets with ≥{min_count} occurrences")
+                print("-" * 60)
+    
+    def save_report(self, output_file: str, min_count: int = 2, samples: int = 0) -> None:
+        """Save duplicate IPs to a file.
+        
+        With ``samples`` up to that many raw log lines per IP, read through
+        ``line_indexes``, are added in a quoted column, one per line.
+        """
+        duplicates = self.sorted_duplicates(min_count)
+        # Field aggregates, denylist tags (separated by ';') and samples get extra columns
+        tag_header = ",Bytes,Distinct Paths,First Seen,Last Seen,Status Codes,Methods" if self.fields else ""
+        if self.denylists:
+            tag_header += ",Tags"
+        if samples:
+            tag_header += ",Sample Lines"
+        
+        def tag_column(ip):
+            column = ""
+            if self.fields:
+                fields = self.ip_fields(ip) or {'bytes': 0, 'distinct_paths': 0, 'first_seen': None,
+                                                'last_seen': None, 'statuses': {}, 'methods': {}}
+                column += (f",{fields['bytes']},{fields['distinct_paths']},{format_time(fields['first_seen'])},"
+                           f"{format_time(fields['last_seen'])},"
+                           f"{';'.join(f'{name}:{count}' for name, count in fields['statuses'].items())},"
+                           f"{';'.join(f'{name}:{count}' for name, count in fields['methods'].items())}")
+            if self.denylists:
+                column += f",{';'.join(self.ip_tags(ip))}"
+            if samples:
+                sample = '\n'.join(self.sample_lines(ip, samples))
+                column += ',"' + sample.replace('"', '""') + '"'
+            return column
         
         try:
             with open(output_file, 'w') as f:
-                f.write("IP Address,Count,First Line,Last Line\n")
-                for ip, count in sorted(duplicates.items(), key=lambda x: x[1], reverse=True):
+                if self.approximate:
+                    # No line numbers are kept; report each count's error bound instead
+                    f.write(f"IP Address,Count,Max Overestimate{tag_header}\n")
+                    for ip, count in duplicates:
+                        f.write(f"{ip},{count},{self.count_error(ip)}{tag_column(ip)}\n")
+                    print(f"📁 Report saved to: {output_file}")
+                    return
+                
+                f.write(f"IP Address,Count,First Line,Last Line{tag_header}\n")
+                for ip, count in duplicates:
                     lines = self.ip_lines[ip]
-                    first_line = min(lines)
-                    last_line = max(lines)
-                    f.write(f"{ip},{count},{first_line},{last_line}\n")
+                    first_line = self.format_line(min(lines))
+                    last_line = self.format_line(max(lines))
+                    f.write(f"{ip},{count},{first_line},{last_line}{tag_column(ip)}\n")
             
             print(f"📁 Report saved to: {output_file}")
             
@@ -169,6 +1925,597 @@ class IPDetector:
             print(f"Error saving report: {e}")
 
 
+class SlidingWindowCounter:
+    """Per-IP hit counts over the last ``window`` seconds.
+    
+    Every batch of hits is appended to a deque once and popped once when it
+    leaves the window, so keeping the counts current costs O(1) amortized
+    per event no matter how often they are read.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        self.counts = Counter()
+        self._events = deque()
+    
+    def add(self, counts: Mapping, now: float) -> None:
+        """Record a batch of {key: hits} observed at time ``now``."""
+        for key, count in counts.items():
+            self._events.append((now, key, count))
+            self.counts[key] += count
+    
+    def expire(self, now: float) -> None:
+        """Drop the hits that are older than the window."""
+        cutoff = now - self.window
+        events = self._events
+        while events and events[0][0] <= cutoff:
+            _, key, count = events.popleft()
+            remaining = self.counts[key] - count
+            if remaining:
+                self.counts[key] = remaining
+            else:
+                del self.counts[key]
+    
+    def top(self, n: int) -> List[Tuple[object, int]]:
+        """The n keys with the most hits inside the window."""
+        return self.counts.most_common(n)
+
+
+class LogFollower:
+    """Read the lines appended to a log file, like ``tail -F``.
+    
+    Rotation (the path now points to a different inode) is handled by
+    draining the old file and continuing at the start of the new one.
+    Truncation is detected when the file shrank below the read position, or
+    when the last byte read has changed because the file was truncated and
+    refilled between two polls; either way reading restarts at offset 0.
+    """
+    
+    def __init__(self, filepath: str, encoding: str = 'utf-8', from_start: bool = False):
+        self.filepath = filepath
+        self.encoding = encoding
+        self._partial = b''
+        self._open(from_start)
+    
+    def _open(self, from_start: bool) -> None:
+        # Unbuffered, so re-reading the last byte always sees the file's current content
+        self._file = open(self.filepath, 'rb', buffering=0)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        if not from_start:
+            self._file.seek(0, os.SEEK_END)
+        self._last_byte = self._byte_before(self._file.tell())
+    
+    def _byte_before(self, position: int) -> bytes:
+        """The byte just before ``position`` (b'' at the start of the file)."""
+        if position == 0:
+            return b''
+        self._file.seek(position - 1)
+        return self._file.read(1)
+    
+    def _truncated(self) -> bool:
+        position = self._file.tell()
+        if os.fstat(self._file.fileno()).st_size < position:
+            return True
+        truncated = self._byte_before(position) != self._last_byte
+        self._file.seek(position)
+        return truncated
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def read_lines(self) -> List[str]:
+        """Return the complete lines written since the previous call."""
+        if self._truncated():
+            self._file.seek(0)
+            self._partial = b''
+        data = self._partial + self._file.read()
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            # Rotated away and not recreated yet; keep reading the old file
+            stat = None
+        
+        if stat is not None and stat.st_ino != self._inode:
+            # The old file is drained, so its unterminated last line is complete
+            if data and not data.endswith(b'\n'):
+                data += b'\n'
+            self._file.close()
+            self._open(from_start=True)
+            data += self._file.read()
+        
+        self._last_byte = self._byte_before(self._file.tell())
+        *lines, self._partial = data.split(b'\n')
+        return [line.decode(self.encoding, errors='replace') for line in lines]
+
+
+def format_time(seconds: float) -> str:
+    """UTC time of an epoch timestamp as 'YYYY-MM-DD HH:MM:SS' ('' for None)."""
+    if seconds is None:
+        return ""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+def format_fields(fields: dict) -> str:
+    """One-line summary of an IP's field aggregates for the text report."""
+    statuses = ', '.join(f"{status}×{count}" for status, count in fields['statuses'].items())
+    methods = ', '.join(f"{method}×{count}" for method, count in fields['methods'].items())
+    seen = f"{format_time(fields['first_seen'])} → {format_time(fields['last_seen'])} UTC"
+    return (f"status {statuses} | {methods} | {fields['bytes']:,} bytes | "
+            f"{fields['distinct_paths']:,} distinct paths | {seen}")
+
+
+def parse_duration(text: str) -> float:
+    """Parse '90', '90s', '15m' or '1h' into seconds."""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def parse_prefix_lengths(text: str) -> List[int]:
+    """Parse a comma-separated list of prefix lengths such as '24,16'."""
+    return [int(length.strip().lstrip('/')) for length in text.split(',') if length.strip()]
+
+
+def follow_log_file(detector: IPDetector, filepath: str, windows: List[float], encoding: str = 'utf-8',
+                    interval: float = 10.0, top_n: int = 10, from_start: bool = False,
+                    poll_interval: float = 1.0, clock: Callable[[], float] = time.monotonic) -> None:
+    """Tail a growing log, updating the detector and sliding-window counts.
+    
+    New lines are parsed into a batch detector which is merged into
+    ``detector`` and fed to one SlidingWindowCounter per window. The top IPs
+    of every window are printed every ``interval`` seconds. Runs until
+    interrupted with Ctrl+C.
+    """
+    follower = LogFollower(filepath, encoding, from_start)
+    detector._add_source(filepath, detector.total_lines + 1)
+    counters = [SlidingWindowCounter(window) for window in windows]
+    batch_settings = dict(detector._settings(), approximate=False)
+    next_report = clock() + interval
+    
+    try:
+        while True:
+            lines = follower.read_lines()
+            now = clock()
+            if lines:
+                batch = IPDetector(**batch_settings)
+                batch._scan_lines(lines)
+                detector.merge(batch, line_offset=detector.total_lines)
+                for counter in counters:
+                    counter.add(batch._counts, now)
+            
+            if now >= next_report:
+                for counter in counters:
+                    counter.expire(now)
+                print_window_report(detector, counters, top_n)
+                next_report = now + interval
+            
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\n⏹  Stopped following log file")
+    finally:
+        follower.close()
+
+
+def print_window_report(detector: IPDetector, counters: List[SlidingWindowCounter], top_n: int) -> None:
+    """Print the current top IPs for each sliding window."""
+    print(f"\n⏱  {time.strftime('%Y-%m-%d %H:%M:%S')} | "
+          f"lines: {detector.total_lines:,} | unique IPs: {len(detector.ip_counts):,}")
+    for counter in counters:
+        print(f"   Last {counter.window:g}s ({sum(counter.counts.values()):,} hits):")
+        for key, count in counter.top(top_n):
+            ip = detector.key_to_ip(key)
+            tags = detector.ip_tags(ip)
+            print(f"      {ip:<15} | {count:>5}" + (f" | ⛔ {', '.join(tags)}" if tags else ""))
+    sys.stdout.flush()
+
+
+def chunk_offsets(filepath: str, chunks: int, start: int = 0, end: int = None) -> List[int]:
+    """Split a file (or its bytes start:end) into at most ``chunks`` ranges that start on a new line.
+    
+    Returns the sorted boundary offsets, beginning with ``start`` and ending
+    with ``end`` (default: the file size), so ``offsets[i]:offsets[i + 1]``
+    is one chunk.
+    """
+    if end is None:
+        end = os.path.getsize(filepath)
+    offsets = [start]
+    with open(filepath, 'rb') as f:
+        for i in range(1, chunks):
+            f.seek(max(start + (end - start) * i // chunks, offsets[-1]))
+            if f.tell() > 0:
+                # Finish the line we landed in so the chunk starts on a new one
+                f.seek(f.tell() - 1)
+                f.readline()
+            if offsets[-1] < f.tell() < end:
+                offsets.append(f.tell())
+    offsets.append(end)
+    return offsets
+
+
+def last_line_end(filepath: str) -> int:
+    """Offset just past the file's last newline (0 if it has none)."""
+    with open(filepath, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            step = min(position, 64 * 1024)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b'\n')
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def file_fingerprint(filepath: str, offset: int) -> dict:
+    """Identify a log file and its first ``offset`` bytes cheaply.
+    
+    Combines device and inode with hashes of the first and last
+    FINGERPRINT_BYTES before ``offset``. If the log was rotated, truncated
+    or rewritten, at least one of these will differ.
+    """
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.read(min(offset, FINGERPRINT_BYTES))
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        tail = f.read(offset - f.tell())
+    return {
+        'device': stat.st_dev,
+        'inode': stat.st_ino,
+        'offset': offset,
+        'head': hashlib.sha256(head).hexdigest(),
+        'tail': hashlib.sha256(tail).hexdigest(),
+    }
+
+
+def load_checkpoint(detector: IPDetector, filepath: str, state_file: str) -> int:
+    """Restore a detector from a --state file and return the offset to resume from.
+    
+    Returns 0 (leaving the detector untouched) when there is no usable
+    checkpoint: the file is missing or unreadable, was written with other
+    settings, or the log has been rotated or replaced since.
+    """
+    try:
+        with open(state_file) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable state file '{state_file}': {e}")
+        return 0
+    
+    saved = checkpoint.get('file', {})
+    offset = saved.get('offset', 0)
+    if (checkpoint.get('version') != CHECKPOINT_VERSION
+            or os.path.getsize(filepath) < offset
+            or file_fingerprint(filepath, offset) != saved):
+        print("🔄 Log was rotated or replaced since the last run; starting over")
+        return 0
+    
+    restored = IPDetector(**detector._settings())
+    try:
+        restored.restore_state(checkpoint['state'])
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"🔄 Saved state does not match this run ({e}); starting over")
+        return 0
+    detector.merge(restored)
+    return offset
+
+
+def save_checkpoint(detector: IPDetector, filepath: str, state_file: str, offset: int) -> None:
+    """Atomically write the detector state and log fingerprint to a --state file."""
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'file': file_fingerprint(filepath, offset),
+        'state': detector.to_state(),
+    }
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_file, state_file)
+
+
+def process_with_checkpoint(detector: IPDetector, filepath: str, state_file: str,
+                            encoding: str = 'utf-8', workers: int = 1) -> None:
+    """Process only the part of an append-only log that is new since the last run.
+    
+    The checkpoint covers complete lines only. A trailing line that is still
+    being written is counted for this run's report but left out of the
+    state, so the next run reads it again once it is complete.
+    """
+    offset = load_checkpoint(detector, filepath, state_file)
+    if offset:
+        print(f"♻️  Resuming after {offset:,} bytes ({detector.total_lines:,} lines) from {state_file}")
+    
+    end = max(last_line_end(filepath), offset)
+    detector.process_log_file(filepath, encoding, workers, start=offset, end=end)
+    save_checkpoint(detector, filepath, state_file, end)
+    
+    size = os.path.getsize(filepath)
+    if size > end:
+        detector.process_log_file(filepath, encoding, start=end, end=size)
+
+
+def save_state_file(detector: IPDetector, state_file: str) -> None:
+    """Atomically write a detector's results to a binary state file.
+    
+    The file is a gzip stream: STATE_MAGIC, the format version and a JSON
+    header (settings, line count, sources and any sketches), then one
+    record per IP in first-seen order holding its count, its line numbers
+    as little-endian uint32 and its key. State files from several hosts
+    can be combined with ``merge_state_files``.
+    """
+    header = json.dumps(detector._state_header()).encode('utf-8')
+    compact = detector.storage == 'compact'
+    temp_file = f"{state_file}.tmp"
+    with gzip.open(temp_file, 'wb') as f:
+        f.write(STATE_MAGIC + _STATE_HEAD.pack(STATE_FORMAT_VERSION, len(header)) + header)
+        for key, count in detector._counts.items():
+            raw = key.to_bytes((key.bit_length() + 7) // 8, 'big') if compact else key.encode('ascii')
+            lines = detector._lines.get(key, ())
+            lines = lines if isinstance(lines, array) else array('I', lines)
+            if sys.byteorder == 'big':
+                lines = array('I', lines)
+                lines.byteswap()
+            f.write(_STATE_RECORD.pack(count, len(lines), len(raw)) + raw + lines.tobytes())
+    os.replace(temp_file, state_file)
+
+
+def read_state_header(f, state_file: str) -> dict:
+    """Check the magic and format version of an open state file and return its header."""
+    if f.read(len(STATE_MAGIC)) != STATE_MAGIC:
+        raise ValueError(f"'{state_file}' is not a duplicate IP detector state file")
+    version, size = _STATE_HEAD.unpack(f.read(_STATE_HEAD.size))
+    if version != STATE_FORMAT_VERSION:
+        raise ValueError(f"'{state_file}' uses state format {version}, not {STATE_FORMAT_VERSION}")
+    return json.loads(f.read(size))
+
+
+def read_state_records(f, state_file: str, compact: bool) -> Iterable[Tuple[object, int, array]]:
+    """Yield the (key, count, line numbers) records that follow a state file's header."""
+    while True:
+        head = f.read(_STATE_RECORD.size)
+        if not head:
+            return
+        try:
+            count, line_count, key_size = _STATE_RECORD.unpack(head)
+            raw = f.read(key_size)
+            lines = array('I')
+            lines.frombytes(f.read(line_count * lines.itemsize))
+        except (struct.error, ValueError):
+            raise ValueError(f"'{state_file}' is truncated or corrupt") from None
+        if len(raw) != key_size or len(lines) != line_count:
+            raise ValueError(f"'{state_file}' is truncated or corrupt")
+        if sys.byteorder == 'big':
+            lines.byteswap()
+        yield (int.from_bytes(raw, 'big') if compact else raw.decode('ascii')), count, lines
+
+
+def merge_state_files(state_files: List[str]) -> IPDetector:
+    """Combine state files written by ``save_state_file`` into one detector.
+    
+    Files are merged in the given order and streamed record by record, so
+    only the combined result is kept in memory. Counts, line numbers and
+    first-seen order come out exactly as if the shards' logs had been
+    concatenated in that order and scanned in one pass. Raises ValueError
+    if a file is not a state file or was made with other settings than the
+    first one.
+    """
+    detector = settings = None
+    for state_file in state_files:
+        with gzip.open(state_file, 'rb') as f:
+            header = read_state_header(f, state_file)
+            if detector is None:
+                settings = header['settings']
+                detector = IPDetector(**{key: value for key, value in settings.items() if key != 'allowlist'})
+                detector._allowlist_fingerprint = settings['allowlist']
+            elif header['settings'] != settings:
+                raise ValueError(f"'{state_file}' was made with different settings than '{state_files[0]}'")
+            compact = detector.storage == 'compact'
+            detector.merge_state_records(header, read_state_records(f, state_file, compact))
+    return detector
+
+
+def build_log_index(detector: IPDetector, filepath: str, index_file: str = None) -> str:
+    """Write a line index for one plain log file and return its path.
+    
+    The index maps every IP the detector would count to the byte offsets
+    of its lines (see INDEX_SUFFIX for the layout), so ``LogIndex`` can
+    fetch them with a few seeks. IPs are keyed by value like compact
+    storage, so zero-padded spellings share their postings. The index also
+    records the log's fingerprint, which lets a lookup notice when the log
+    was rotated or rewritten.
+    """
+    index_file = index_file or filepath + INDEX_SUFFIX
+    size = os.path.getsize(filepath)
+    offsets = detector.line_offsets(filepath)
+    header = json.dumps({
+        'log': os.path.abspath(filepath),
+        'file': file_fingerprint(filepath, size),
+        'settings': {'log_format': detector.format, 'ipv6': detector.ipv6},
+    }).encode('utf-8')
+    
+    keys = sorted(offsets)
+    position = len(INDEX_MAGIC) + _INDEX_HEAD.size + len(header) + len(keys) * _INDEX_ENTRY.size
+    temp_file = f"{index_file}.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(INDEX_MAGIC + _INDEX_HEAD.pack(INDEX_FORMAT_VERSION, len(header), len(keys)) + header)
+        for key in keys:
+            f.write(_INDEX_ENTRY.pack(key.to_bytes(17, 'big'), position, len(offsets[key])))
+            position += len(offsets[key]) * 8
+        for key in keys:
+            postings = offsets[key]
+            if sys.byteorder == 'big':
+                postings.byteswap()
+            f.write(postings.tobytes())
+    os.replace(temp_file, index_file)
+    return index_file
+
+
+class LogIndex:
+    """Read-only view of a line index written by ``build_log_index``.
+    
+    Looking up an IP binary-searches the on-disk directory, reads that IP's
+    postings and seeks to each of its lines, so the cost depends on the
+    number of hits and not on the size of the log. Raises ValueError if
+    the file is not an index or the log no longer matches it.
+    """
+    
+    def __init__(self, index_file: str, encoding: str = 'utf-8'):
+        self.index_file = index_file
+        self.encoding = encoding
+        self._index = open(index_file, 'rb')
+        try:
+            if self._index.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"'{index_file}' is not a line index")
+            version, header_size, self._entries = _INDEX_HEAD.unpack(self._index.read(_INDEX_HEAD.size))
+            if version != INDEX_FORMAT_VERSION:
+                raise ValueError(f"'{index_file}' uses index format {version}, not {INDEX_FORMAT_VERSION}")
+            header = json.loads(self._index.read(header_size))
+            self._directory = self._index.tell()
+            self.log = header['log']
+            self.settings = header['settings']
+            indexed = header['file']
+            if (not os.path.exists(self.log) or os.path.getsize(self.log) < indexed['offset']
+                    or file_fingerprint(self.log, indexed['offset']) != indexed):
+                raise ValueError(f"'{self.log}' changed since '{index_file}' was built; rebuild it")
+            # Bytes appended to the log after the index was built are not covered
+            self.unindexed_bytes = os.path.getsize(self.log) - indexed['offset']
+        except Exception:
+            self._index.close()
+            raise
+        self._log = None
+    
+    def close(self) -> None:
+        self._index.close()
+        if self._log:
+            self._log.close()
+    
+    def __enter__(self) -> 'LogIndex':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def offsets(self, ip: str) -> array:
+        """Byte offsets of the lines ``ip`` appears on, in file order."""
+        try:
+            target = pack_ip(ip).to_bytes(17, 'big')
+        except (ValueError, OverflowError):
+            return array('Q')
+        lo, hi = 0, self._entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self._index.seek(self._directory + mid * _INDEX_ENTRY.size)
+            key, position, count = _INDEX_ENTRY.unpack(self._index.read(_INDEX_ENTRY.size))
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                postings = array('Q')
+                self._index.seek(position)
+                postings.frombytes(self._index.read(count * postings.itemsize))
+                if sys.byteorder == 'big':
+                    postings.byteswap()
+                return postings
+        return array('Q')
+    
+    def lines(self, ip: str, limit: int = None) -> List[str]:
+        """The raw log lines (without line endings) that ``ip`` appears on."""
+        offsets = self.offsets(ip)[:limit]
+        if self._log is None:
+            self._log = open(self.log, 'rb')
+        lines = []
+        for offset in offsets:
+            self._log.seek(offset)
+            lines.append(self._log.readline().rstrip(b'\r\n').decode(self.encoding, errors='replace'))
+        return lines
+
+
+def _stream_item_size(item) -> int:
+    """Size of a ``scan_stream`` item, which must be a str line or a bytes-like chunk."""
+    if isinstance(item, (str, bytes, bytearray)):
+        return len(item)
+    if isinstance(item, memoryview):
+        return item.nbytes
+    raise TypeError(f"stream items must be str lines or bytes chunks, not {type(item).__name__}")
+
+
+def _parse_file(settings: dict, filepath: str, encoding: str) -> IPDetector:
+    """Parse one whole (possibly compressed) log file in a worker process."""
+    detector = IPDetector(**settings)
+    detector._add_source(filepath, 1)
+    detector._scan_file(filepath, encoding)
+    detector._candidates.clear()
+    return detector
+
+
+def _parse_chunk(settings: dict, filepath: str, start: int, end: int, encoding: str) -> IPDetector:
+    """Parse one byte range of a log file in a worker process.
+    
+    Line numbers in the returned detector are relative to the chunk; the
+    parent process shifts them while merging.
+    """
+    detector = IPDetector(**settings)
+    detector._scan_file_range(filepath, start, end, encoding)
+    detector._candidates.clear()
+    return detector
+
+
+@contextmanager
+def _exit_on_error(filepath: str):
+    """Report file errors the way the command line tool always has and exit."""
+    try:
+        yield
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename or filepath}' not found.")
+        sys.exit(1)
+    except UnicodeDecodeError:
+        print(f"Error: Could not decode file '{filepath}'. Try different encoding.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error processing file: {e}")
+        sys.exit(1)
+
+
+def is_compressed(filepath: str) -> bool:
+    """True for logs read through a decompressor (.gz, .bz2, .xz, .lzma)."""
+    return os.path.splitext(filepath)[1].lower() in COMPRESSED_OPENERS
+
+
+def expand_log_paths(patterns: List[str]) -> List[str]:
+    """Expand files, directories and glob patterns into a list of log files.
+    
+    Directories contribute the (non-hidden) files directly inside them and
+    globs their matches, each in sorted order; duplicates are dropped.
+    Paths that match nothing are returned unchanged so the caller can report
+    them as missing.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(str(path) for path in Path(pattern).iterdir()
+                             if path.is_file() and not path.name.startswith('.'))
+        elif any(char in pattern for char in '*?['):
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        else:
+            matches = [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def check_ascii_compatible(encoding: str) -> None:
+    """Raise ValueError unless the encoding stores ASCII text as plain bytes.
+    
+    The mmap engine matches byte patterns directly, which only works when
+    digits, dots and newlines are single ASCII bytes (utf-8, latin1, ...).
+    """
+    if '0.9\n'.encode(encoding) != b'0.9\n':
+        raise ValueError(f"the mmap engine needs an ASCII-compatible encoding, not '{encoding}'")
+
+
 def create_sample_log():
     """Create a sample log file for testing."""
     sample_content = """192.168.1.1 - - [25/Dec/2024:10:00:01] "GET / HTTP/1.1" 200 1234
@@ -187,8 +2534,13 @@ def create_sample_log():
     print("📝 Created sample_access.log for testing")
 
 
-def main():
+def main(argv: List[str] = None):
     """Main function to handle command line arguments and run the detector."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['merge']:
+        merge_main(argv[1:])
+        return
+    
     parser = argparse.ArgumentParser(
         description="Detect duplicate IP addresses in log files",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -197,25 +2549,85 @@ Examples:
   %(prog)s access.log
   %(prog)s --min-count 5 --format apache access.log
   %(prog)s --output duplicates.csv --show-lines server.log
+  %(prog)s --workers 8 huge_access.log
+  %(prog)s --engine mmap --workers 8 huge_access.log
+  %(prog)s --approximate --top 20 edge_node.log
+  %(prog)s --follow --windows 1m,15m --interval 30 access.log
+  %(prog)s --state access.state.json access.log  # only parse new lines
+  %(prog)s --workers 4 /var/log/nginx/ 'archive/access.log.*.gz'
+  %(prog)s --engine numpy --top 20 huge_access.log
+  %(prog)s --ipv6 --subnets 24,16 --subnets6 64 access.log
+  %(prog)s --allowlist our_lbs.txt --denylist tor_exits.txt access.log
+  %(prog)s --export-state web1.ipstate access.log  # on every host, then:
+  %(prog)s merge web1.ipstate web2.ipstate --top 20
+  %(prog)s --build-index --output duplicates.csv --samples 3 access.log
+  %(prog)s --lookup 192.168.1.1 access.log  # uses the index, no rescan
+  %(prog)s --format apache --fields --top 20 access.log
+  %(prog)s --profile --stats-json run.json --engine mmap huge_access.log
   %(prog)s --create-sample  # Create a sample log for testing
         """
     )
     
-    parser.add_argument('logfile', nargs='?', help='Path to the log file to analyze')
-    parser.add_argument('--min-count', '-c', type=int, default=2,
-                        help='Minimum count to consider as duplicate (default: 2)')
+    parser.add_argument('logfile', nargs='*',
+                        help='Log files, directories or glob patterns to analyze '
+                             '(.gz, .bz2 and .xz files are decompressed on the fly)')
+    add_report_arguments(parser)
     parser.add_argument('--format', '-f', choices=['apache', 'nginx', 'generic'], 
                         default='generic', help='Log format (default: generic)')
-    parser.add_argument('--output', '-o', help='Save results to CSV file')
-    parser.add_argument('--show-lines', '-l', action='store_true',
-                        help='Show line numbers where IPs appear')
-    parser.add_argument('--top', '-t', type=int, help='Show only top N duplicate IPs')
     parser.add_argument('--encoding', '-e', default='utf-8',
                         help='File encoding (default: utf-8)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Parse the file in N parallel processes (default: 1)')
+    parser.add_argument('--engine', choices=ENGINES, default='python',
+                        help='Scanning engine: decoded lines, a memory-mapped bytes '
+                             'scan, or the same scan counted with NumPy (default: python). '
+                             'mmap and numpy refuse logs with bare \\r line endings')
+    parser.add_argument('--storage', choices=STORAGES, default='dict',
+                        help='Counter backend: per-IP strings and lists, or packed '
+                             'uint32 keys with array postings (default: dict)')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Use constant-memory sketches: approximate top-N counts '
+                             'and unique-IP estimate, with error bounds')
+    parser.add_argument('--sketch-size', type=int, default=10000,
+                        help='Heavy hitters tracked in --approximate mode (default: 10000)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep reading lines appended to the log (handles rotation '
+                             'and truncation) and report sliding-window counts')
+    parser.add_argument('--windows', default='1m,15m',
+                        help='Comma-separated sliding windows for --follow, e.g. 90s,1m,1h '
+                             '(default: 1m,15m)')
+    parser.add_argument('--interval', type=parse_duration, default=10.0,
+                        help='How often --follow prints the top IPs (default: 10s)')
+    parser.add_argument('--from-start', action='store_true',
+                        help='With --follow, process the existing content first')
+    parser.add_argument('--state', metavar='FILE',
+                        help='Checkpoint file: resume after the bytes parsed by the '
+                             'previous run and save the new position')
+    parser.add_argument('--ipv6', action='store_true',
+                        help='Also detect IPv6 addresses')
+    parser.add_argument('--fields', action='store_true',
+                        help='Also aggregate status codes, methods, bytes, distinct paths and '
+                             'first/last seen per IP from combined-format apache/nginx lines')
+    parser.add_argument('--allowlist', action='append', default=[], metavar='FILE',
+                        help='Ignore IPs in the addresses/CIDR blocks listed in FILE '
+                             '(one per line; may be repeated)')
+    parser.add_argument('--build-index', action='store_true',
+                        help=f'Write a line index (<logfile>{INDEX_SUFFIX}) mapping each IP to the '
+                             'byte offsets of its lines')
+    parser.add_argument('--lookup', metavar='IP',
+                        help='Print the lines containing IP using the line indexes, without '
+                             'scanning the logs')
+    parser.add_argument('--samples', type=int, default=0, metavar='N',
+                        help='Add up to N raw log lines per IP to the CSV report (needs line indexes)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Show a progress bar while scanning and print per-stage timings, '
+                             'throughput and peak memory after the report')
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help='Write the per-stage timings, throughput and peak memory to FILE as JSON')
     parser.add_argument('--create-sample', action='store_true',
                         help='Create a sample log file for testing')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Create sample log if requested
     if args.create_sample:
@@ -226,21 +2638,268 @@ Examples:
     if not args.logfile:
         parser.error("logfile is required (use --create-sample to generate test data)")
     
-    if not Path(args.logfile).exists():
-        print(f"Error: File '{args.logfile}' does not exist.")
-        sys.exit(1)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
+    if args.approximate and args.show_lines:
+        parser.error("--show-lines is not available with --approximate")
+    
+    if args.engine == 'numpy' and np is None:
+        parser.error("--engine numpy needs NumPy (pip install numpy)")
+    
+    if args.engine == 'numpy' and args.approximate:
+        parser.error("--approximate uses its own sketches; pick --engine mmap instead of numpy")
+    
+    check_report_arguments(parser, args)
+    
+    if args.subnets6 and not args.ipv6:
+        parser.error("--subnets6 needs --ipv6")
+    
+    if args.follow and args.workers > 1:
+        parser.error("--follow reads the log as it grows and cannot use --workers")
+    
+    if args.follow and args.state:
+        parser.error("--state cannot be combined with --follow")
+    
+    if args.fields and args.format not in ('apache', 'nginx'):
+        parser.error("--fields parses combined logs; use it with --format apache or nginx")
+    
+    if args.fields and (args.approximate or args.follow or args.state or args.export_state):
+        parser.error("--fields cannot be combined with --approximate, --follow, --state or --export-state")
+    
+    if args.follow and args.build_index:
+        parser.error("--build-index cannot be combined with --follow")
+    
+    if args.follow and (args.profile or args.stats_json):
+        parser.error("--profile and --stats-json measure a finished run and cannot be combined with --follow")
+    
+    if args.samples and not args.output:
+        parser.error("--samples adds a column to the --output CSV report")
+    
+    logfiles = expand_log_paths(args.logfile)
+    for logfile in logfiles:
+        if not Path(logfile).exists():
+            print(f"Error: File '{logfile}' does not exist.")
+            sys.exit(1)
+    
+    if (args.follow or args.state) and (len(logfiles) > 1 or is_compressed(logfiles[0])):
+        parser.error("--follow and --state need a single uncompressed log file")
+    
+    if args.lookup:
+        lookup_lines(args.lookup, logfiles, args.encoding)
+        return
+    
+    plain_logfiles = [logfile for logfile in logfiles if not is_compressed(logfile)]
+    # Existing indexes are checked before the scan; new ones are opened once built
+    line_indexes = []
+    if args.samples and not args.build_index:
+        line_indexes = open_log_indexes(plain_logfiles, args.encoding)
     
     # Run the detector
-    print(f"🔍 Analyzing log file: {args.logfile}")
+    if len(logfiles) == 1:
+        print(f"🔍 Analyzing log file: {logfiles[0]}")
+    else:
+        print(f"🔍 Analyzing {len(logfiles)} log files: {', '.join(logfiles)}")
     print(f"📋 Format: {args.format}, Min count: {args.min_count}")
     
-    detector = IPDetector(args.format)
-    detector.process_log_file(args.logfile, args.encoding)
-    detector.print_report(args.min_count, args.show_lines, args.top)
+    profiler = None
+    if args.profile or args.stats_json:
+        profiler = PipelineProfiler(sum(os.path.getsize(logfile) for logfile in logfiles),
+                                    show_progress=args.profile)
+    stage = profiler.stage if profiler else lambda name: nullcontext()
+    
+    with stage('setup'):
+        try:
+            allowlist = RangeIndex.from_files(args.allowlist) if args.allowlist else None
+        except (OSError, ValueError) as e:
+            print(f"Error reading network list: {e}")
+            sys.exit(1)
+        if allowlist is not None:
+            print(f"✅ Allowlist: ignoring {len(allowlist):,} address ranges")
+        denylists = load_denylists(args.denylist)
+    
+    # Line numbers are only needed for --show-lines, the CSV report and
+    # exported state (so that merged reports can show them)
+    track_lines = (args.show_lines or bool(args.output) or bool(args.export_state)) and not args.approximate
+    detector = IPDetector(args.format, args.engine, track_lines=track_lines, storage=args.storage,
+                          approximate=args.approximate, sketch_size=args.sketch_size, ipv6=args.ipv6,
+                          allowlist=allowlist, fields=args.fields)
+    detector.denylists = denylists
+    if profiler:
+        detector.attach_profiler(profiler)
+    if args.follow:
+        windows = [parse_duration(window) for window in args.windows.split(',')]
+        follow_log_file(detector, logfiles[0], windows, args.encoding, args.interval,
+                        args.top or 10, args.from_start)
+    else:
+        with stage('scan'):
+            if args.state:
+                process_with_checkpoint(detector, logfiles[0], args.state, args.encoding, args.workers)
+            else:
+                detector.process_log_files(logfiles, args.encoding, args.workers)
+        if profiler:
+            profiler.finish_progress()
+    
+    if args.build_index:
+        with _exit_on_error(', '.join(plain_logfiles)), stage('index'):
+            check_ascii_compatible(args.encoding)
+            for logfile in logfiles:
+                if is_compressed(logfile):
+                    print(f"⚠️  Not indexing compressed log '{logfile}' (offsets need random access)")
+                else:
+                    print(f"🗂️  Line index saved to: {build_log_index(detector, logfile)}")
+        if args.samples:
+            line_indexes = open_log_indexes(plain_logfiles, args.encoding)
+    detector.line_indexes = line_indexes
+    with stage('report'):
+        write_reports(detector, args, args.samples)
+    
+    if args.profile:
+        profiler.print_summary(detector)
+    if args.stats_json:
+        save_stats_json(profiler, detector, args.stats_json, logfiles, args.workers)
+
+
+def save_stats_json(profiler: PipelineProfiler, detector: IPDetector, stats_file: str,
+                    logfiles: List[str], workers: int) -> None:
+    """Atomically write the profiler summary of a finished run to ``stats_file``."""
+    stats = {'files': logfiles, 'workers': workers}
+    stats.update(profiler.summary(detector))
+    temp_file = f"{stats_file}.tmp"
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(temp_file, stats_file)
+    except OSError as e:
+        print(f"Error writing stats: {e}")
+        sys.exit(1)
+    print(f"📈 Run statistics saved to: {stats_file}")
+
+
+def open_log_indexes(logfiles: List[str], encoding: str) -> List[LogIndex]:
+    """Open the line index of every log file, exiting with a message if one is unusable."""
+    indexes = []
+    for logfile in logfiles:
+        try:
+            indexes.append(LogIndex(logfile + INDEX_SUFFIX, encoding))
+        except FileNotFoundError:
+            print(f"Error: No line index for '{logfile}'; run with --build-index first.")
+            sys.exit(1)
+        except (OSError, ValueError) as e:
+            print(f"Error reading line index: {e}")
+            sys.exit(1)
+        if indexes[-1].unindexed_bytes:
+            print(f"⚠️  {indexes[-1].unindexed_bytes:,} bytes appended to '{logfile}' since it was "
+                  f"indexed are not covered; rebuild with --build-index")
+    return indexes
+
+
+def lookup_lines(ip: str, logfiles: List[str], encoding: str) -> None:
+    """Print the lines of each log that contain ``ip``, read through their line indexes.
+    
+    The output is often piped into ``head`` or ``grep -m``; when the reader
+    goes away, the rest is discarded quietly instead of raising.
+    """
+    try:
+        for index in open_log_indexes(logfiles, encoding):
+            with index:
+                lines = index.lines(ip)
+                print(f"🔎 {ip} in {index.log}: {len(lines):,} line{'s' if len(lines) != 1 else ''}")
+                for line in lines:
+                    print(line)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Point stdout at devnull so the flush at interpreter exit cannot fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def merge_main(argv: List[str]) -> None:
+    """The ``merge`` subcommand: one report from state files saved with --export-state."""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} merge",
+        description="Combine state files saved with --export-state into one report",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+The report is the same as a single run over the shards' logs concatenated
+in the order the state files are given.
+
+Examples:
+  %(prog)s web1.ipstate web2.ipstate web3.ipstate --top 20
+  %(prog)s --export-state all.ipstate --output duplicates.csv 'shards/*.ipstate'
+        """
+    )
+    parser.add_argument('statefile', nargs='+', help='State files (or glob patterns), in log order')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    check_report_arguments(parser, args)
+    
+    state_files = expand_log_paths(args.statefile)
+    print(f"🔗 Merging {len(state_files)} state file(s): {', '.join(state_files)}")
+    try:
+        detector = merge_state_files(state_files)
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Error merging state files: {e}")
+        sys.exit(1)
+    if (args.show_lines or args.output) and not (detector.track_lines or detector.approximate):
+        print("Error: the state files hold no line numbers for --show-lines/--output")
+        sys.exit(1)
+    detector.denylists = load_denylists(args.denylist)
+    write_reports(detector, args)
+
+
+def add_report_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shared by log scans and the merge subcommand."""
+    parser.add_argument('--min-count', '-c', type=int, default=2,
+                        help='Minimum count to consider as duplicate (default: 2)')
+    parser.add_argument('--output', '-o', help='Save results to CSV file')
+    parser.add_argument('--show-lines', '-l', action='store_true',
+                        help='Show line numbers where IPs appear')
+    parser.add_argument('--top', '-t', type=int, help='Show only top N duplicate IPs')
+    parser.add_argument('--subnets', type=parse_prefix_lengths, default=[], metavar='LENGTHS',
+                        help='Also report the top IPv4 subnets at these prefix lengths, e.g. 24,16')
+    parser.add_argument('--subnets6', type=parse_prefix_lengths, default=[], metavar='LENGTHS',
+                        help='Also report the top IPv6 subnets at these prefix lengths, e.g. 64,48 '
+                             '(needs --ipv6)')
+    parser.add_argument('--denylist', action='append', default=[], metavar='FILE',
+                        help='Tag IPs in the addresses/CIDR blocks listed in FILE with the '
+                             'file name in the report and CSV (may be repeated)')
+    parser.add_argument('--export-state', metavar='FILE',
+                        help='Save the results to a binary state file for the merge subcommand')
+
+
+def check_report_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if any(not 0 <= length <= 32 for length in args.subnets):
+        parser.error("--subnets prefix lengths must be between 0 and 32")
+    
+    if any(not 0 <= length <= 128 for length in args.subnets6):
+        parser.error("--subnets6 prefix lengths must be between 0 and 128")
+
+
+def load_denylists(filepaths: List[str]) -> Dict[str, RangeIndex]:
+    """Load each --denylist file as a RangeIndex tagged with the file name."""
+    try:
+        denylists = {Path(path).stem: RangeIndex.from_files([path]) for path in filepaths}
+    except (OSError, ValueError) as e:
+        print(f"Error reading network list: {e}")
+        sys.exit(1)
+    for tag, ranges in denylists.items():
+        print(f"⛔ Denylist '{tag}': {len(ranges):,} address ranges")
+    return denylists
+
+
+def write_reports(detector: IPDetector, args: argparse.Namespace, samples: int = 0) -> None:
+    """Print the report and write the CSV and state files that were asked for."""
+    detector.print_report(args.min_count, args.show_lines, args.top, args.subnets, args.subnets6)
     
     # Save to file if requested
     if args.output:
-        detector.save_report(args.output, args.min_count)
+        detector.save_report(args.output, args.min_count, samples)
+    
+    if args.export_state:
+        save_state_file(detector, args.export_state)
+        print(f"💾 State saved to: {args.export_state}")
 
 
 if __name__ == "__main__":
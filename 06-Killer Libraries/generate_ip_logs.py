@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Synthetic Log Generator
+=======================
+
+Writes realistic access/auth logs, from a few MB to many GB, for
+benchmarking and testing duplicate_ip_detector.py.
+
+IP frequencies follow a Zipf distribution over a configurable number of
+distinct addresses (a few very busy clients and a long tail of rare ones,
+as in real traffic), and lines are drawn from a weighted mix of Apache
+combined, Nginx "main" and syslog-style (generic) formats. Every line
+carries exactly one client IP.
+
+Usage:
+    python3 generate_ip_logs.py <output> [options]
+
+Examples:
+    python3 generate_ip_logs.py --size 100MB access.log
+    python3 generate_ip_logs.py --size 2GB --ips 1000000 --skew 1.2 huge_access.log
+    python3 generate_ip_logs.py --lines 50000 --formats apache=1 --seed 7 small.log
+    python3 generate_ip_logs.py --size 500MB --ipv6-share 0.2 access.log.gz
+"""
+
+import argparse
+import gzip
+import random
+import re
+import sys
+import time
+from itertools import accumulate
+from typing import Dict, List
+
+FORMATS = ('apache', 'nginx', 'generic')
+METHODS = ('GET', 'GET', 'GET', 'GET', 'POST', 'POST', 'HEAD', 'PUT', 'DELETE')
+STATUSES = (200, 200, 200, 200, 200, 200, 304, 301, 404, 404, 403, 500, 502)
+PATHS = ('/', '/index.html', '/api/v1/items', '/api/v1/users', '/login', '/logout',
+         '/static/app.js', '/static/style.css', '/search', '/favicon.ico', '/health')
+AGENTS = ('Mozilla/5.0 (X11; Linux x86_64)', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
+          'curl/8.4.0', 'python-requests/2.31', 'Googlebot/2.1')
+SSH_EVENTS = ('Failed password for root', 'Failed password for invalid user admin',
+              'Accepted publickey for deploy', 'Connection closed by authenticating user git')
+
+BATCH_LINES = 10000
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text: str) -> int:
+    """Parse a size such as '512KB', '100MB' or '2.5GB' into bytes."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', text.upper())
+    if not match:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_format_mix(text: str) -> Dict[str, float]:
+    """Parse a format mix such as 'apache=6,nginx=3,generic=1' into weights."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FORMATS:
+            raise ValueError(f"unknown format {name!r} (choose from {', '.join(FORMATS)})")
+        mix[name] = float(weight) if weight else 1.0
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("the format mix needs at least one positive weight")
+    return mix
+
+
+def make_ips(count: int, rng: random.Random, ipv6_share: float = 0.0) -> List[str]:
+    """``count`` distinct addresses in random order, ``ipv6_share`` of them IPv6.
+
+    IPv4 addresses are spread over the whole public space by an odd
+    multiplier (a bijection modulo 2**32), so they share no common prefix
+    the way sequential addresses would.
+    """
+    ips = []
+    offset = rng.getrandbits(32)
+    for index in range(count):
+        if rng.random() < ipv6_share:
+            ips.append(f"2001:db8:{index >> 16 & 0xffff:x}:{index & 0xffff:x}::{rng.getrandbits(16):x}")
+        else:
+            key = (index * 2654435761 + offset) & 0xFFFFFFFF
+            ips.append(f"{key >> 24}.{key >> 16 & 255}.{key >> 8 & 255}.{key & 255}")
+    rng.shuffle(ips)
+    return ips
+
+
+def zipf_cum_weights(count: int, skew: float) -> List[float]:
+    """Cumulative Zipf weights ``1 / rank ** skew`` for ranks 1..count (skew 0 is uniform)."""
+    return list(accumulate(1.0 / rank ** skew for rank in range(1, count + 1)))
+
+
+def format_line(fmt: str, ip: str, stamp: str, rng: random.Random) -> str:
+    """One log line in format ``fmt`` for client ``ip`` at CLF time ``stamp``."""
+    if fmt == 'generic':
+        return (f"{stamp[3:6]} {stamp[:2]} {stamp[12:20]} web01 sshd[{rng.randrange(1000, 65000)}]: "
+                f"{rng.choice(SSH_EVENTS)} from {ip} port {rng.randrange(1024, 65536)} ssh2\n")
+    status = rng.choice(STATUSES)
+    size = '-' if status == 304 else rng.randrange(0, 50000)
+    request = f"{rng.choice(METHODS)} {rng.choice(PATHS)}?id={rng.randrange(1000)} HTTP/1.1"
+    line = (f'{ip} - - [{stamp}] "{request}" {status} {size} '
+            f'"https://example.com/" "{rng.choice(AGENTS)}"')
+    if fmt == 'nginx':
+        # nginx's "main" log_format appends $http_x_forwarded_for
+        line += ' "-"'
+    return line + '\n'
+
+
+def generate_log(output_file: str, size: int = None, lines: int = None, ips: int = 100000,
+                 skew: float = 1.1, formats: Dict[str, float] = None, ipv6_share: float = 0.0,
+                 seed: int = None, start_time: float = 1735120800.0, lines_per_second: int = 200) -> dict:
+    """Write a synthetic log of ``size`` bytes or ``lines`` lines (whichever comes first).
+
+    Returns a summary with the number of lines and bytes written. Output
+    ending in '.gz' is gzip-compressed; ``size`` then counts uncompressed
+    bytes. The same ``seed`` always produces the same log.
+    """
+    if size is None and lines is None:
+        raise ValueError("give a size or a number of lines")
+    if ips < 1:
+        raise ValueError("ips must be at least 1")
+    formats = formats or {'apache': 6, 'nginx': 3, 'generic': 1}
+    rng = random.Random(seed)
+    population = make_ips(ips, rng, ipv6_share)
+    cum_weights = zipf_cum_weights(ips, skew)
+    format_names = list(formats)
+    format_weights = list(accumulate(formats[name] for name in format_names))
+
+    written_lines = written_bytes = 0
+    clock = start_time
+    stamp_second = None
+    opener = gzip.open if output_file.endswith('.gz') else open
+    with opener(output_file, 'wt', encoding='ascii', newline='') as f:
+        while (size is None or written_bytes < size) and (lines is None or written_lines < lines):
+            batch = BATCH_LINES if lines is None else min(BATCH_LINES, lines - written_lines)
+            clients = rng.choices(population, cum_weights=cum_weights, k=batch)
+            kinds = rng.choices(format_names, cum_weights=format_weights, k=batch)
+            chunk = []
+            for ip, fmt in zip(clients, kinds):
+                # Time moves forward at roughly lines_per_second; the CLF stamp is cached per second
+                clock += rng.expovariate(lines_per_second)
+                if int(clock) != stamp_second:
+                    stamp_second = int(clock)
+                    stamp = time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime(stamp_second))
+                chunk.append(format_line(fmt, ip, stamp, rng))
+            text = ''.join(chunk)
+            if size is not None and written_bytes + len(text) > size:
+                # Trim the last batch to whole lines so the log stops near the target size
+                keep = text.rfind('\n', 0, size - written_bytes) + 1
+                if keep == 0 and written_lines == 0:
+                    keep = text.index('\n') + 1
+                text = text[:keep]
+                written_lines += text.count('\n')
+                written_bytes += len(text)
+                f.write(text)
+                break
+            f.write(text)
+            written_lines += batch
+            written_bytes += len(text)
+
+    return {'file': output_file, 'lines': written_lines, 'bytes': written_bytes, 'ips': ips,
+            'skew': skew, 'formats': formats, 'ipv6_share': ipv6_share, 'seed': seed}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic logs for duplicate_ip_detector.py',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --size 100MB access.log
+  %(prog)s --size 2GB --ips 1000000 --skew 1.2 huge_access.log
+  %(prog)s --lines 50000 --formats apache=1 --seed 7 small.log
+  %(prog)s --size 500MB --ipv6-share 0.2 access.log.gz
+        """
+    )
+    parser.add_argument('output', help='Log file to write (.gz to compress)')
+    parser.add_argument('--size', type=parse_size,
+                        help='Stop after about this many bytes, e.g. 10MB, 1.5GB (default: 10MB)')
+    parser.add_argument('--lines', type=int, help='Stop after this many lines')
+    parser.add_argument('--ips', type=int, default=100000,
+                        help='Number of distinct client IPs (default: 100000)')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent of IP frequencies; 0 is uniform (default: 1.1)')
+    parser.add_argument('--formats', type=parse_format_mix, default='apache=6,nginx=3,generic=1',
+                        help='Weighted mix of line formats (default: apache=6,nginx=3,generic=1)')
+    parser.add_argument('--ipv6-share', type=float, default=0.0,
+                        help='Fraction of distinct IPs that are IPv6 (default: 0)')
+    parser.add_argument('--seed', type=int, help='Random seed for a reproducible log')
+
+    args = parser.parse_args(argv)
+    if args.size is None and args.lines is None:
+        args.size = parse_size('10MB')
+    if args.ips < 1:
+        parser.error("--ips must be at least 1")
+    if not 0 <= args.ipv6_share <= 1:
+        parser.error("--ipv6-share must be between 0 and 1")
+
+    started = time.perf_counter()
+    try:
+        summary = generate_log(args.output, args.size, args.lines, args.ips, args.skew, args.formats,
+                               args.ipv6_share, args.seed)
+    except OSError as e:
+        print(f"Error writing '{args.output}': {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    print(f"📝 Wrote {summary['lines']:,} lines ({summary['bytes'] / 1024 ** 2:,.1f} MB) to {args.output} "
+          f"in {elapsed:.1f}s ({summary['bytes'] / 1024 ** 2 / max(elapsed, 1e-9):,.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()